@@ -0,0 +1,182 @@
+from typing import Dict, List, Tuple
+import io
+import wave
+import numpy as np
+
+# Google's free recognizer rejects requests much longer than a minute
+MAX_CHUNK_SECONDS = 55
+# Everything downstream of load_pcm works on mono 16-bit PCM at this rate
+TARGET_SAMPLE_RATE = 16000
+
+
+def load_pcm(source, format: str = None) -> np.ndarray:
+    """
+    Decode audio to mono 16 kHz int16 samples without touching the disk.
+
+    Args:
+        source: A pydub AudioSegment, the bytes of an audio file (or a
+            BytesIO/memoryview over them), an int16 array already at the
+            target rate, or a file path
+        format: File format hint for bytes input (e.g. 'wav', 'mp3')
+
+    Returns:
+        np.ndarray: int16 samples at TARGET_SAMPLE_RATE
+    """
+    from pydub import AudioSegment
+
+    if isinstance(source, np.ndarray):
+        return source.astype(np.int16, copy=False)
+    if isinstance(source, str):
+        segment = AudioSegment.from_file(source)
+    elif isinstance(source, AudioSegment):
+        segment = source
+    else:
+        data = source.getvalue() if hasattr(source, 'getvalue') else source
+        if format in (None, 'wav'):
+            # WAV that is already mono 16 kHz 16-bit needs no decoder at all
+            try:
+                with wave.open(io.BytesIO(data), 'rb') as wf:
+                    if (wf.getnchannels(), wf.getframerate(), wf.getsampwidth()) == (1, TARGET_SAMPLE_RATE, 2):
+                        return np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16)
+                # Other WAV layouts can still be read by pydub without ffmpeg
+                format = 'wav'
+            except (wave.Error, EOFError):
+                pass
+        segment = AudioSegment.from_file(io.BytesIO(data), format=format)
+
+    # Resample and downmix in a single pass
+    segment = segment.set_channels(1).set_frame_rate(TARGET_SAMPLE_RATE).set_sample_width(2)
+    return np.frombuffer(segment.raw_data, dtype=np.int16)
+
+
+def to_wav_bytes(segment) -> bytes:
+    """Encode an AudioSegment as WAV in memory (for st.audio playback)."""
+    buffer = io.BytesIO()
+    segment.export(buffer, format="wav")
+    return buffer.getvalue()
+
+
+def frame_energy_db(samples: np.ndarray, sample_rate: int, frame_ms: int = 30) -> np.ndarray:
+    """RMS level of each frame in dBFS, computed over a (frames, frame_len) view of the samples."""
+    frame_len = max(int(sample_rate * frame_ms / 1000), 1)
+    n_frames = len(samples) // frame_len
+    if n_frames == 0:
+        return np.empty((0,), dtype=np.float32)
+    frames = samples[:n_frames * frame_len].reshape(n_frames, frame_len).astype(np.float32)
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    return 20 * np.log10(np.maximum(rms, 1.0) / 32768.0)
+
+
+def _runs(mask: np.ndarray) -> List[Tuple[int, int]]:
+    """[start, end) index pairs of the True runs in a boolean array."""
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return list(zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)))
+
+
+def detect_speech(samples: np.ndarray,
+                  sample_rate: int,
+                  frame_ms: int = 30,
+                  min_silence_ms: int = 600,
+                  padding_ms: int = 200,
+                  floor_db: float = -50.0,
+                  margin_db: float = 12.0) -> Tuple[List[Tuple[int, int]], np.ndarray]:
+    """
+    Energy-based voice activity detection.
+
+    A frame counts as speech when it is margin_db above the recording's noise
+    floor (its 10th percentile level), or within margin_db of its loud end for
+    recordings without pauses, and always above floor_db. Speech regions are
+    padded by padding_ms and pauses shorter than min_silence_ms are bridged, so
+    words are never clipped and short breaths stay inside a region.
+
+    Returns:
+        (regions, energy_db): speech regions as [start, end) frame indices and
+        the per-frame level used to find pauses.
+    """
+    energy = frame_energy_db(samples, sample_rate, frame_ms)
+    if energy.size == 0:
+        return [], energy
+    # Cap the threshold below the loud end so a recording with no pauses still counts as speech
+    noise_floor, loud = np.percentile(energy, [10, 95])
+    threshold = max(min(noise_floor + margin_db, loud - margin_db), floor_db)
+    speech = energy > threshold
+
+    # Dilate by the padding, then close gaps shorter than min_silence
+    pad = max(padding_ms // frame_ms, 0)
+    if pad:
+        speech = np.convolve(speech, np.ones(2 * pad + 1), mode='same') > 0
+    gap = max(min_silence_ms // frame_ms, 1)
+    regions = []
+    for start, end in _runs(speech):
+        if regions and start - regions[-1][1] < gap:
+            regions[-1] = (regions[-1][0], end)
+        else:
+            regions.append((start, end))
+    return regions, energy
+
+
+def _split_long_region(start: int, end: int, energy: np.ndarray, max_frames: int) -> List[Tuple[int, int]]:
+    """Cut a region longer than max_frames at its quietest frames (the most natural pauses)."""
+    pieces = []
+    while end - start > max_frames:
+        # Search the back half of the allowed window so pieces do not get tiny
+        lo, hi = start + max_frames // 2, start + max_frames
+        cut = lo + int(np.argmin(energy[lo:hi]))
+        pieces.append((start, cut))
+        start = cut
+    pieces.append((start, end))
+    return pieces
+
+
+def segment_speech(samples: np.ndarray,
+                   sample_rate: int,
+                   max_chunk_seconds: float = MAX_CHUNK_SECONDS,
+                   frame_ms: int = 30,
+                   **vad_kwargs) -> Tuple[List[np.ndarray], Dict]:
+    """
+    Split a mono int16 recording into recognizer-sized chunks of speech.
+
+    Leading, trailing and long internal silences are dropped; consecutive speech
+    regions are packed into chunks of at most max_chunk_seconds, and a region
+    longer than that is split at its quietest point.
+
+    Args:
+        samples: Mono int16 PCM samples
+        sample_rate: Sample rate of samples
+        max_chunk_seconds: Upper bound on a chunk's length
+        frame_ms: VAD frame size
+        **vad_kwargs: Passed to detect_speech
+
+    Returns:
+        (chunks, stats): a list of int16 arrays and a dict with total_seconds,
+        speech_seconds, speech_ratio and chunks
+    """
+    samples = np.asarray(samples, dtype=np.int16)
+    frame_len = max(int(sample_rate * frame_ms / 1000), 1)
+    max_frames = max(int(max_chunk_seconds * 1000 / frame_ms), 1)
+    regions, energy = detect_speech(samples, sample_rate, frame_ms=frame_ms, **vad_kwargs)
+
+    pieces = []
+    for start, end in regions:
+        pieces.extend(_split_long_region(start, end, energy, max_frames))
+
+    # Greedily pack speech pieces into chunks, leaving the silence between them out
+    chunks, current, current_frames = [], [], 0
+    for start, end in pieces:
+        if current and current_frames + (end - start) > max_frames:
+            chunks.append(np.concatenate(current))
+            current, current_frames = [], 0
+        current.append(samples[start * frame_len:end * frame_len])
+        current_frames += end - start
+    if current:
+        chunks.append(np.concatenate(current))
+
+    total_seconds = len(samples) / float(sample_rate) if sample_rate else 0.0
+    speech_seconds = sum(len(c) for c in chunks) / float(sample_rate) if sample_rate else 0.0
+    stats = {
+        'total_seconds': total_seconds,
+        'speech_seconds': speech_seconds,
+        'speech_ratio': speech_seconds / total_seconds if total_seconds else 0.0,
+        'chunks': len(chunks),
+    }
+    return chunks, stats
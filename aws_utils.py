@@ -1,13 +1,16 @@
-from dotenv import load_dotenv
 import os
-import boto3
-from botocore.client import Config
-import pandas as pd
-from io import StringIO
-from datetime import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import io
+from datetime import date, datetime, timedelta
 import json
+import queue
+import threading
+import time
 
 def get_aws_credentials():
+    from dotenv import load_dotenv
+
     # Try to get the AWS credentials from environment variables first
     load_dotenv()
     aws_access_key_id = os.getenv('AWS_ID')
@@ -21,19 +24,74 @@ def get_aws_credentials():
 
     return aws_access_key_id, aws_secret_access_key
 
-AWS_ID, AWS_SEC = get_aws_credentials()
+# Resolved on first use rather than at import, so importing this module does not
+# read .env or Streamlit secrets (boto3 and pandas are likewise imported lazily)
+_aws_credentials = None
+_aws_credentials_lock = threading.Lock()
+
+
+def _credentials():
+    """(AWS_ID, AWS_SEC) from get_aws_credentials(), looked up once per process."""
+    global _aws_credentials
+    if _aws_credentials is None:
+        with _aws_credentials_lock:
+            if _aws_credentials is None:
+                _aws_credentials = get_aws_credentials()
+    return _aws_credentials
+
+
+def __getattr__(name):
+    # aws_utils.AWS_ID / AWS_SEC still work, resolved on first access
+    if name in ('AWS_ID', 'AWS_SEC'):
+        return _credentials()[name == 'AWS_SEC']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Secrets Manager cache. Secrets are fetched once per process and reused until
+# they expire; entries close to expiry are refreshed in the background so callers
+# on the hot path never wait on the network.
+SECRETS_REGION = "us-east-2"
+SECRET_TTL_SECONDS = float(os.getenv('SECRET_TTL_SECONDS', 900))
+SECRET_REFRESH_AHEAD_SECONDS = float(os.getenv('SECRET_REFRESH_AHEAD_SECONDS', 60))
+
+_secrets_client = None
+_secrets_client_lock = threading.Lock()
+_secret_cache = {}  # secret_name -> (secret_dict, expires_at)
+_secret_cache_lock = threading.Lock()
+_secret_fetch_locks = {}
+_secret_refreshing = set()
+_secret_stats = {'hits': 0, 'misses': 0, 'refreshes': 0, 'invalidations': 0}
+
+
+def configure_secret_cache(ttl=None, refresh_ahead=None):
+    """Change the secret cache TTL and background refresh window (in seconds)."""
+    global SECRET_TTL_SECONDS, SECRET_REFRESH_AHEAD_SECONDS
+    if ttl is not None:
+        SECRET_TTL_SECONDS = float(ttl)
+    if refresh_ahead is not None:
+        SECRET_REFRESH_AHEAD_SECONDS = float(refresh_ahead)
 
-def get_secret(secret_name):
-    region_name = "us-east-2"  # Set to the desired AWS region
-
-    # Create a Secrets Manager client
-    session = boto3.session.Session()
-    client = session.client(
-        service_name='secretsmanager',
-        aws_access_key_id=AWS_ID,
-        aws_secret_access_key=AWS_SEC,
-        region_name=region_name
-    )
+
+def _get_secrets_client():
+    """Return the process-wide Secrets Manager client, creating it on first use."""
+    global _secrets_client
+    if _secrets_client is None:
+        with _secrets_client_lock:
+            if _secrets_client is None:
+                import boto3
+
+                aws_id, aws_sec = _credentials()
+                session = boto3.session.Session()
+                _secrets_client = session.client(
+                    service_name='secretsmanager',
+                    aws_access_key_id=aws_id,
+                    aws_secret_access_key=aws_sec,
+                    region_name=SECRETS_REGION
+                )
+    return _secrets_client
+
+
+def _fetch_secret(secret_name):
+    client = _get_secrets_client()
 
     try:
         get_secret_value_response = client.get_secret_value(
@@ -55,66 +113,778 @@ def get_secret(secret_name):
         raise Exception('Binary secret format is not supported.')
 
 
-def connect_to_s3(timeout=10, client=False):
-    """Establish a connection to S3 using the credentials in config.py."""
-    # Create a Config object with the desired timeout settings
-    config = Config(
-        connect_timeout=timeout,
-        read_timeout=timeout,
-        retries={'max_attempts': 3}  # Example of setting max retry attempts
+def _store_secret(secret_name, secret_dict):
+    with _secret_cache_lock:
+        _secret_cache[secret_name] = (secret_dict, time.monotonic() + SECRET_TTL_SECONDS)
+
+
+def _refresh_secret(secret_name):
+    try:
+        _store_secret(secret_name, _fetch_secret(secret_name))
+        with _secret_cache_lock:
+            _secret_stats['refreshes'] += 1
+    except Exception as e:
+        # Keep serving the cached value until it actually expires
+        print(f"Background refresh of secret {secret_name} failed: {e}")
+    finally:
+        with _secret_cache_lock:
+            _secret_refreshing.discard(secret_name)
+
+
+def get_secret(secret_name):
+    """Return a secret as a dict, served from the process-wide cache when fresh."""
+    now = time.monotonic()
+    with _secret_cache_lock:
+        entry = _secret_cache.get(secret_name)
+        if entry is not None and entry[1] > now:
+            _secret_stats['hits'] += 1
+            if entry[1] - now < SECRET_REFRESH_AHEAD_SECONDS and secret_name not in _secret_refreshing:
+                _secret_refreshing.add(secret_name)
+                threading.Thread(target=_refresh_secret, args=(secret_name,), daemon=True).start()
+            return dict(entry[0])
+        _secret_stats['misses'] += 1
+        fetch_lock = _secret_fetch_locks.setdefault(secret_name, threading.Lock())
+
+    # Only one thread fetches a given secret; the others wait and reuse its result
+    with fetch_lock:
+        with _secret_cache_lock:
+            entry = _secret_cache.get(secret_name)
+        if entry is not None and entry[1] > time.monotonic():
+            return dict(entry[0])
+        secret_dict = _fetch_secret(secret_name)
+        _store_secret(secret_name, secret_dict)
+        return dict(secret_dict)
+
+
+def invalidate_secret(secret_name=None):
+    """Drop a cached secret (or all of them), e.g. after a 401 from a downstream API."""
+    with _secret_cache_lock:
+        if secret_name is None:
+            _secret_cache.clear()
+        else:
+            _secret_cache.pop(secret_name, None)
+        _secret_stats['invalidations'] += 1
+
+
+def secret_cache_stats():
+    """Return hit/miss counters for the secret cache."""
+    with _secret_cache_lock:
+        stats = dict(_secret_stats)
+        stats['cached'] = len(_secret_cache)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+    return stats
+
+
+# Shared S3 clients. boto3 clients are thread-safe, so every function here (and
+# every thread) reuses one client per timeout and its connection pool stays warm.
+# Resources are not thread-safe and are cached per thread instead.
+# S3_ENDPOINT_URL points the module at a local S3 stand-in (moto server, MinIO).
+S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL') or None
+S3_MAX_POOL_CONNECTIONS = int(os.getenv('S3_MAX_POOL_CONNECTIONS', 32))
+S3_CONNECT_TIMEOUT_SECONDS = float(os.getenv('S3_CONNECT_TIMEOUT_SECONDS', 10))
+S3_READ_TIMEOUT_SECONDS = float(os.getenv('S3_READ_TIMEOUT_SECONDS', 10))
+S3_RETRY_MODE = os.getenv('S3_RETRY_MODE', 'legacy')
+S3_MAX_ATTEMPTS = int(os.getenv('S3_MAX_ATTEMPTS', 4))
+
+_s3_session = None
+_s3_clients = {}  # timeout -> client
+_s3_generation = 0  # bumped by configure_s3 so per-thread resources are rebuilt
+_s3_lock = threading.Lock()
+_s3_local = threading.local()
+
+
+def configure_s3(endpoint_url=None, max_pool_connections=None, connect_timeout=None, read_timeout=None,
+                 retry_mode=None, max_attempts=None):
+    """
+    Change the S3 client settings. Clients and resources are rebuilt on next use.
+
+    Args:
+        endpoint_url (str): S3-compatible endpoint to use instead of AWS ('' for AWS again)
+        max_pool_connections (int): HTTP connections kept per client
+        connect_timeout, read_timeout (float): Seconds
+        retry_mode (str): botocore retry mode ('legacy', 'standard' or 'adaptive')
+        max_attempts (int): Attempts per request, including the first
+    """
+    global S3_ENDPOINT_URL, S3_MAX_POOL_CONNECTIONS, S3_CONNECT_TIMEOUT_SECONDS, S3_READ_TIMEOUT_SECONDS
+    global S3_RETRY_MODE, S3_MAX_ATTEMPTS, _s3_generation
+    with _s3_lock:
+        if endpoint_url is not None:
+            S3_ENDPOINT_URL = endpoint_url or None
+        if max_pool_connections is not None:
+            S3_MAX_POOL_CONNECTIONS = int(max_pool_connections)
+        if connect_timeout is not None:
+            S3_CONNECT_TIMEOUT_SECONDS = float(connect_timeout)
+        if read_timeout is not None:
+            S3_READ_TIMEOUT_SECONDS = float(read_timeout)
+        if retry_mode is not None:
+            S3_RETRY_MODE = retry_mode
+        if max_attempts is not None:
+            S3_MAX_ATTEMPTS = int(max_attempts)
+        _s3_clients.clear()
+        _s3_generation += 1
+        # Bucket existence was checked against the previous endpoint
+        _known_buckets.clear()
+
+
+def _s3_config(timeout=None):
+    from botocore.client import Config
+
+    return Config(
+        connect_timeout=timeout or S3_CONNECT_TIMEOUT_SECONDS,
+        read_timeout=timeout or S3_READ_TIMEOUT_SECONDS,
+        max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+        retries={'mode': S3_RETRY_MODE, 'total_max_attempts': S3_MAX_ATTEMPTS},
     )
 
-    if client:
-        # Use boto3.client for low-level API access
-        s3 = boto3.client(
-            's3',
-            aws_access_key_id=AWS_ID,
-            aws_secret_access_key=AWS_SEC,
-            config=config
-        )
-    else:
-        # Use boto3.resource for high-level resource access
-        s3 = boto3.resource(
-            's3',
-            aws_access_key_id=AWS_ID,
-            aws_secret_access_key=AWS_SEC,
-            config=config
-        )
 
-    return s3
+def _get_s3_session():
+    # Callers hold _s3_lock; creating clients from one session is not thread-safe
+    global _s3_session
+    if _s3_session is None:
+        import boto3
+
+        aws_id, aws_sec = _credentials()
+        _s3_session = boto3.session.Session(aws_access_key_id=aws_id, aws_secret_access_key=aws_sec)
+    return _s3_session
+
+
+def get_s3_client(timeout=None):
+    """Return the process-wide S3 client, creating it on first use."""
+    client = _s3_clients.get(timeout)
+    if client is None:
+        with _s3_lock:
+            client = _s3_clients.get(timeout)
+            if client is None:
+                client = _get_s3_session().client('s3', endpoint_url=S3_ENDPOINT_URL, config=_s3_config(timeout))
+                _s3_clients[timeout] = client
+    return client
+
+
+def get_s3_resource(timeout=None):
+    """Return the calling thread's S3 resource, creating it on first use."""
+    resources = getattr(_s3_local, 'resources', None)
+    if resources is None or _s3_local.generation != _s3_generation:
+        resources = _s3_local.resources = {}
+        _s3_local.generation = _s3_generation
+    resource = resources.get(timeout)
+    if resource is None:
+        with _s3_lock:
+            resource = _get_s3_session().resource('s3', endpoint_url=S3_ENDPOINT_URL, config=_s3_config(timeout))
+        resources[timeout] = resource
+    return resource
+
+
+def connect_to_s3(timeout=None, client=False):
+    """
+    Return the shared S3 client (client=True) or this thread's S3 resource.
+
+    Args:
+        timeout (float): Connect and read timeout in seconds (default
+            S3_CONNECT_TIMEOUT_SECONDS / S3_READ_TIMEOUT_SECONDS)
+        client (bool): Low-level client instead of a resource
+    """
+    return get_s3_client(timeout) if client else get_s3_resource(timeout)
+
+
+# Listing. cloud_dump names objects after the dump time, so a date range maps to
+# key prefixes (one per day, month or year) that can be listed in parallel.
+S3_LIST_MAX_WORKERS = int(os.getenv('S3_LIST_MAX_WORKERS', 8))
+DUMP_TIMESTAMP_FORMAT = '%Y%m%d%H%M%S'
+DUMP_TIMESTAMP_LENGTH = 14
+CSV_SUFFIXES = ('.csv', '.csv.gz', '.csv.zst')  # plain and compressed cloud_dump files
+PARTITION_PREFIX = 'date='  # Hive partitions of Parquet dumps: date=YYYY-MM-DD/<dump time>...
+
+_manifest_lock = threading.Lock()
+
+
+def _s3_client(s3):
+    """The low-level client behind a boto3 resource (or the client itself)."""
+    if s3 is None:
+        return get_s3_client()
+    return getattr(s3.meta, 'client', s3)
+
+
+def _dump_stamp(value, end_of_day=False):
+    """A datetime, date or ISO string as a cloud_dump file name timestamp."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value) if len(value) > 10 else date.fromisoformat(value)
+    if not isinstance(value, datetime):
+        value = datetime.combine(value, datetime.max.time() if end_of_day else datetime.min.time())
+    return value.strftime(DUMP_TIMESTAMP_FORMAT)
+
+
+def _date_prefixes(start, end, sep=''):
+    """The fewest year/month/day key prefixes that cover the dates start..end (inclusive)."""
+    prefixes = []
+    day = start
+    while day <= end:
+        next_month = (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+        if day.month == 1 and day.day == 1 and date(day.year, 12, 31) <= end:
+            prefixes.append(f"{day.year:04d}")
+            day = date(day.year + 1, 1, 1)
+        elif day.day == 1 and next_month - timedelta(days=1) <= end:
+            prefixes.append(f"{day.year:04d}{sep}{day.month:02d}")
+            day = next_month
+        else:
+            prefixes.append(f"{day.year:04d}{sep}{day.month:02d}{sep}{day.day:02d}")
+            day += timedelta(days=1)
+    return prefixes
+
+
+def _range_prefixes(base, start_stamp, end_stamp, partitioned=False):
+    if start_stamp is None:
+        return [base]
+    end_stamp = end_stamp or datetime.now().strftime(DUMP_TIMESTAMP_FORMAT)
+    start_day = datetime.strptime(start_stamp[:8], '%Y%m%d').date()
+    end_day = datetime.strptime(end_stamp[:8], '%Y%m%d').date()
+    return [base + p for p in _date_prefixes(start_day, end_day, sep='-' if partitioned else '')]
+
+
+def _list_pages(client, bucket_name, prefix, start_after, stop):
+    """Yield the keys of each list_objects_v2 page under prefix, after start_after."""
+    kwargs = {'Bucket': bucket_name, 'Prefix': prefix}
+    if start_after:
+        kwargs['StartAfter'] = start_after
+    for page in client.get_paginator('list_objects_v2').paginate(**kwargs):
+        if stop.is_set():
+            return
+        yield [obj['Key'] for obj in page.get('Contents', [])]
+
+
+def _fan_out_pages(client, bucket_name, prefixes, start_after=None, max_workers=S3_LIST_MAX_WORKERS):
+    """Yield pages of keys from several prefixes listed concurrently, as they arrive."""
+    if start_after:
+        # Every key under these prefixes sorts before start_after
+        prefixes = [p for p in prefixes if start_after[:len(p)] <= p]
+    stop = threading.Event()
+    if len(prefixes) <= 1:
+        for p in prefixes:
+            yield from _list_pages(client, bucket_name, p, start_after, stop)
+        return
+
+    pages = queue.Queue()
+
+    def list_prefix(p):
+        try:
+            for keys in _list_pages(client, bucket_name, p, start_after, stop):
+                pages.put(keys)
+        except Exception as e:
+            pages.put(e)
+        finally:
+            pages.put(None)
+
+    pool = ThreadPoolExecutor(max_workers=min(max_workers, len(prefixes)), thread_name_prefix="s3-list")
+    try:
+        for p in prefixes:
+            pool.submit(list_prefix, p)
+        remaining = len(prefixes)
+        while remaining:
+            item = pages.get()
+            if item is None:
+                remaining -= 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                yield item
+    finally:
+        # Also reached when the caller stops iterating early
+        stop.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _load_manifest(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _is_dump_key(key, stamp_offset):
+    stamp = key[stamp_offset:stamp_offset + DUMP_TIMESTAMP_LENGTH]
+    return stamp.isdigit() and len(stamp) == DUMP_TIMESTAMP_LENGTH
+
+
+def _update_manifest(path, entry_name, keys, stamp_offset, replace=False):
+    """Merge newly listed keys into a manifest entry (or replace it) and write the file atomically."""
+    with _manifest_lock:
+        manifest = _load_manifest(path)
+        entry = {} if replace else manifest.get(entry_name, {})
+        known = sorted(set(entry.get('keys', [])).union(keys))
+        # Other names (e.g. notes.txt) would sort after every dump and hide new
+        # ones; with no dump recorded yet the next call lists everything again
+        dumps = [k for k in known if _is_dump_key(k, stamp_offset)]
+        manifest[entry_name] = {'keys': known, 'last_key': dumps[-1] if dumps else None}
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, path)
+
+
+def list_s3_keys(bucket_name, s3=None, prefix='', start=None, end=None, suffix=CSV_SUFFIXES,
+                 manifest_path=None, refresh=False, max_workers=S3_LIST_MAX_WORKERS, partitioned=False):
+    """
+    Yield the keys under prefix in an S3 bucket, page by page as they are listed.
+
+    With start and/or end, only cloud_dump files whose timestamp falls in the
+    range are yielded, and the range is listed as parallel day/month/year
+    prefixes, so keys then arrive out of order. With partitioned=True the same
+    applies to the date=YYYY-MM-DD/ partitions written by
+    cloud_dump(file_format='parquet').
+
+    With manifest_path, every key listed is recorded in a local JSON index.
+    Later calls yield the recorded keys straight from it and only list keys
+    after the newest one recorded. The index is written once the listing has
+    been consumed completely; keys deleted from S3 stay in it until a call
+    with refresh=True rebuilds it.
+
+    Args:
+        bucket_name (str): Bucket to list
+        s3: boto3 resource or client (defaults to the shared client)
+        prefix (str): Key prefix the dump file names start after
+        start, end (datetime | date | str): Inclusive dump time range; a date
+            end covers that whole day
+        suffix (str | tuple): Only yield keys ending with this (None for all keys);
+            by default plain and compressed CSV dumps
+        manifest_path (str): Local index file for incremental listings
+        refresh (bool): Ignore the index and list everything again
+        max_workers (int): Prefixes listed at once
+        partitioned (bool): List Hive date partitions under prefix
+
+    Returns:
+        Iterator[str]: Object keys
+    """
+    client = _s3_client(s3)
+    start_stamp = _dump_stamp(start) if start is not None else None
+    end_stamp = _dump_stamp(end, end_of_day=True) if end is not None else None
+    # Dump file names start after the prefix (and the partition directory)
+    base = prefix + PARTITION_PREFIX if partitioned else prefix
+    stamp_offset = len(base) + len('YYYY-MM-DD/') if partitioned else len(base)
+
+    def wanted(key):
+        if suffix and not key.endswith(suffix):
+            return False
+        stamp = key[stamp_offset:stamp_offset + DUMP_TIMESTAMP_LENGTH]
+        return (start_stamp is None or stamp >= start_stamp) and (end_stamp is None or stamp <= end_stamp)
+
+    if manifest_path is None:
+        for keys in _fan_out_pages(client, bucket_name, _range_prefixes(base, start_stamp, end_stamp, partitioned),
+                                   max_workers=max_workers):
+            yield from filter(wanted, keys)
+        return
+
+    entry_name = f"{bucket_name}/{base}"
+    entry = {} if refresh else _load_manifest(manifest_path).get(entry_name, {})
+    last_key = entry.get('last_key')
+    if last_key is not None and not _is_dump_key(last_key, stamp_offset):
+        # Older indexes could record a non-dump name, which new dumps sort before
+        last_key = None
+    yield from filter(wanted, entry.get('keys', []))
+
+    # The index covers every key up to last_key, so only later keys are listed;
+    # listing from last_key's day (not from start) keeps that coverage unbroken
+    if last_key is not None:
+        last_stamp = last_key[stamp_offset:stamp_offset + DUMP_TIMESTAMP_LENGTH]
+        prefixes = _range_prefixes(base, last_stamp, end_stamp, partitioned)
+    else:
+        prefixes = [base]
+    known = set(entry.get('keys', []))
+    new_keys = []
+    for keys in _fan_out_pages(client, bucket_name, prefixes, start_after=last_key, max_workers=max_workers):
+        keys = [k for k in keys if k not in known]
+        new_keys.extend(keys)
+        yield from filter(wanted, keys)
+    _update_manifest(manifest_path, entry_name, new_keys, stamp_offset, replace=refresh)
 
 
 def retrieve_csv_files_from_s3(bucket_name, s3):
-    """Retrieve all CSV files from an S3 bucket."""
-    bucket = s3.Bucket(bucket_name)
-    csv_files = [obj.key for obj in bucket.objects.all() if obj.key.endswith('.csv')]
-    return csv_files
-
-def load_csv_from_s3(bucket_name, file_key, s3):
-    """Load a CSV file from S3 into a Pandas DataFrame."""
-    client = s3.meta.client
-    csv_obj = client.get_object(Bucket=bucket_name, Key=file_key)
-    csv_data = csv_obj['Body'].read().decode('utf-8')
-    return pd.read_csv(StringIO(csv_data))
-
-def delete_file_from_s3(bucket_name, file_key, s3):
+    """Retrieve all (plain or compressed) CSV files from an S3 bucket (see list_s3_keys for ranges and incremental listing)."""
+    return list(list_s3_keys(bucket_name, s3))
+
+# Reading. Objects are parsed while they download: small ones straight from the
+# response body, larger ones as byte ranges fetched in parallel and fed to the
+# parser in order, so at most S3_RANGE_MAX_WORKERS parts are held in memory.
+S3_RANGE_PART_BYTES = int(os.getenv('S3_RANGE_PART_BYTES', 8 * 1024 * 1024))
+S3_RANGE_MAX_WORKERS = int(os.getenv('S3_RANGE_MAX_WORKERS', 8))
+S3_LOAD_MAX_WORKERS = int(os.getenv('S3_LOAD_MAX_WORKERS', 8))
+
+
+class _RangedObjectReader(io.RawIOBase):
+    """
+    Seekable, read-only file over an S3 object, read with byte-range GETs.
+
+    With prefetch (for streaming a whole object) the part at the current
+    position is streamed from its response while the following parts are
+    fetched ahead in parallel; a seek restarts that pipeline at the new
+    offset. Without prefetch every read is exactly one ranged GET, which suits
+    readers that jump around, like Parquet's footer-then-column-chunk access.
+    Every range is pinned to the first ETag seen, so an object overwritten
+    mid-read fails instead of mixing versions.
+    """
+
+    def __init__(self, client, bucket_name, key, part_bytes=S3_RANGE_PART_BYTES, max_workers=S3_RANGE_MAX_WORKERS,
+                 prefetch=True):
+        self._client, self._bucket_name, self._key = client, bucket_name, key
+        self._part_bytes, self._max_workers, self._prefetch_parts = part_bytes, max(1, max_workers), prefetch
+        self.size = None
+        self._etag = None
+        self._position = 0
+        self._started = False
+        self._current = None
+        self._pending = deque()
+        self._parts = deque()
+        self._pool = None
+
+    def _get(self, start, end, stream=False):
+        kwargs = {'IfMatch': self._etag} if self._etag else {}
+        response = self._client.get_object(Bucket=self._bucket_name, Key=self._key,
+                                           Range=f"bytes={start}-{end}", **kwargs)
+        self._etag = self._etag or response.get('ETag')
+        if self.size is None:
+            self.size = int(response['ContentRange'].rsplit('/', 1)[1])
+        return response['Body'] if stream else response['Body'].read()
+
+    def _ensure_size(self):
+        if self.size is None:
+            head = self._client.head_object(Bucket=self._bucket_name, Key=self._key)
+            self.size, self._etag = head['ContentLength'], self._etag or head.get('ETag')
+        return self.size
+
+    def _start(self):
+        """Stream the part at the current position and schedule the parts after it."""
+        self._started = True
+        try:
+            self._current = self._get(self._position, self._position + self._part_bytes - 1, stream=True)
+        except self._client.exceptions.ClientError as e:
+            # Ranges are not satisfiable at the end of an object (or on an empty one)
+            if e.response.get('Error', {}).get('Code') != 'InvalidRange':
+                raise
+            self._ensure_size()
+            return
+        self._pending.extend((start, min(start + self._part_bytes, self.size) - 1)
+                             for start in range(self._position + self._part_bytes, self.size, self._part_bytes))
+        if self._pending and self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix="s3-range")
+        self._prefetch()
+
+    def _prefetch(self):
+        while self._pending and len(self._parts) < self._max_workers:
+            self._parts.append(self._pool.submit(self._get, *self._pending.popleft()))
+
+    def _stop(self):
+        for part in self._parts:
+            part.cancel()
+        self._parts.clear()
+        self._pending.clear()
+        if self._current is not None:
+            self._current.close()
+            self._current = None
+        self._started = False
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            base = 0
+        elif whence == io.SEEK_CUR:
+            base = self._position
+        else:
+            base = self._ensure_size()
+        position = max(0, base + offset)
+        if position != self._position:
+            self._stop()
+            self._position = position
+        return position
+
+    def readinto(self, buffer):
+        if not self._prefetch_parts:
+            end = min(self._position + len(buffer), self._ensure_size())
+            if end <= self._position:
+                return 0
+            data = self._get(self._position, end - 1)
+        else:
+            if not self._started:
+                self._start()
+            while True:
+                data = self._current.read(len(buffer)) if self._current is not None else b''
+                if data or not self._parts:
+                    break
+                self._current = io.BytesIO(self._parts.popleft().result())
+                self._prefetch()
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def close(self):
+        self._stop()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+        super().close()
+
+
+def open_s3_object(bucket_name, file_key, s3=None, part_bytes=S3_RANGE_PART_BYTES, max_workers=S3_RANGE_MAX_WORKERS):
+    """Open an S3 object as a buffered binary file that downloads ahead of the reader."""
+    return io.BufferedReader(_RangedObjectReader(_s3_client(s3), bucket_name, file_key, part_bytes, max_workers),
+                             buffer_size=1024 * 1024)
+
+
+def load_csv_from_s3(bucket_name, file_key, s3=None, chunksize=None, **read_csv_kwargs):
+    """
+    Load a CSV file from S3 into a Pandas DataFrame, parsing while it downloads.
+
+    Args:
+        bucket_name (str): Bucket holding the file
+        file_key (str): Object key
+        s3: boto3 resource or client (defaults to the shared client)
+        chunksize (int): Return an iterator of DataFrames with this many rows
+            each instead of one DataFrame
+        **read_csv_kwargs: Passed on to pandas.read_csv (usecols, dtype, ...)
+
+    Returns:
+        DataFrame, or an iterator of DataFrames when chunksize is given
+    """
+    import pandas as pd
+
+    read_csv_kwargs.setdefault('compression', _csv_compression(file_key))
+    body = open_s3_object(bucket_name, file_key, s3)
+    if chunksize is not None:
+        return _iter_chunks(pd.read_csv(body, chunksize=chunksize, **read_csv_kwargs), body)
+    with body:
+        return pd.read_csv(body, **read_csv_kwargs)
+
+
+def _iter_chunks(reader, body):
+    with reader, body:
+        yield from reader
+
+
+def load_many(bucket_name, keys, s3=None, max_workers=S3_LOAD_MAX_WORKERS, key_column=None, **read_csv_kwargs):
+    """
+    Load many CSV files concurrently into one DataFrame, in the order of keys.
+
+    Args:
+        bucket_name (str): Bucket holding the files
+        keys (Iterable[str]): Object keys, e.g. from list_s3_keys
+        s3: boto3 resource or client (defaults to the shared client)
+        max_workers (int): Files downloaded at once
+        key_column (str): If given, add a column with each row's source key
+        **read_csv_kwargs: Passed on to pandas.read_csv
+
+    Returns:
+        DataFrame: All rows (an empty DataFrame when there are no keys)
+    """
+    import pandas as pd
+
+    client = _s3_client(s3)
+    keys = list(keys)
+
+    def load(key):
+        # Each file already parallelises its own large downloads; keep the total in check
+        body = open_s3_object(bucket_name, key, client, max_workers=max(1, S3_RANGE_MAX_WORKERS // max_workers))
+        with body:
+            frame = pd.read_csv(body, **{'compression': _csv_compression(key), **read_csv_kwargs})
+        if key_column is not None:
+            frame[key_column] = key
+        return frame
+
+    if not keys:
+        return pd.DataFrame()
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(keys)), thread_name_prefix="s3-load") as pool:
+        frames = list(pool.map(load, keys))
+    return pd.concat(frames, ignore_index=True)
+
+def delete_file_from_s3(bucket_name, file_key, s3=None):
     """Delete a specific file from an S3 bucket."""
-    obj = s3.Object(bucket_name, file_key)
-    obj.delete()
-
-def cloud_dump(setlist, args=None, dump_all=False):
-    # Initialize AWS S3 resources and client
-    s3_resource = boto3.resource(
-        's3',
-        aws_access_key_id=AWS_ID,
-        aws_secret_access_key=AWS_SEC
-    )
-    
-    s3_client = boto3.client(
-        's3',
-        aws_access_key_id=AWS_ID,
-        aws_secret_access_key=AWS_SEC
-    )
+    _s3_client(s3).delete_object(Bucket=bucket_name, Key=file_key)
+
+# Writing. Dumps are serialized straight into a compressed spool (in memory up to
+# S3_DUMP_SPOOL_BYTES, then on disk) and uploaded with the managed transfer,
+# which switches to parallel multipart uploads above one part.
+DUMP_COMPRESSION = os.getenv('S3_DUMP_COMPRESSION', 'gzip')  # gzip, zstd or none
+S3_DUMP_SPOOL_BYTES = int(os.getenv('S3_DUMP_SPOOL_BYTES', 32 * 1024 * 1024))
+S3_UPLOAD_PART_BYTES = int(os.getenv('S3_UPLOAD_PART_BYTES', 8 * 1024 * 1024))
+S3_UPLOAD_MAX_CONCURRENCY = int(os.getenv('S3_UPLOAD_MAX_CONCURRENCY', 8))
+PARQUET_COMPRESSION = os.getenv('S3_PARQUET_COMPRESSION', 'zstd')
+DUMP_BOOLEAN_COLUMNS = ('in_database', 'is_hallucination')
+
+_COMPRESSION_SUFFIXES = {'gzip': '.gz', 'zstd': '.zst', 'none': ''}
+
+_known_buckets = set()
+_known_buckets_lock = threading.Lock()
+
+
+def ensure_bucket(bucket_name, s3=None):
+    """Create bucket_name if it does not exist. Checked once per process."""
+    if bucket_name in _known_buckets:
+        return
+    client = _s3_client(s3)
+    with _known_buckets_lock:
+        if bucket_name in _known_buckets:
+            return
+        try:
+            client.head_bucket(Bucket=bucket_name)
+        except client.exceptions.ClientError as e:
+            if e.response.get('Error', {}).get('Code') not in ('404', 'NoSuchBucket'):
+                raise
+            try:
+                client.create_bucket(Bucket=bucket_name)
+                print(f"S3 bucket {bucket_name} created.")
+            except client.exceptions.BucketAlreadyOwnedByYou:
+                pass
+        _known_buckets.add(bucket_name)
+
+
+def _csv_compression(file_key):
+    """pandas compression argument for a dump file name."""
+    if file_key.endswith('.gz'):
+        return 'gzip'
+    if file_key.endswith('.zst'):
+        return 'zstd'
+    return None
+
+
+def _resolve_compression(compression):
+    compression = (compression or 'none').lower()
+    if compression not in _COMPRESSION_SUFFIXES:
+        raise ValueError(f"Unknown compression {compression!r}; use one of {sorted(_COMPRESSION_SUFFIXES)}")
+    if compression == 'zstd':
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            print("zstandard is not installed (pip install zstandard); compressing with gzip instead.")
+            return 'gzip'
+    return compression
+
+
+def write_csv_compressed(df, compression=DUMP_COMPRESSION):
+    """
+    Serialize a DataFrame as CSV into a compressed, rewound binary spool file.
+
+    Args:
+        df (DataFrame): Rows to write (without the index)
+        compression (str): 'gzip', 'zstd' or 'none'
+
+    Returns:
+        SpooledTemporaryFile: The encoded bytes; the caller closes it
+    """
+    import gzip
+    import tempfile
+
+    compression = _resolve_compression(compression)
+    spool = tempfile.SpooledTemporaryFile(max_size=S3_DUMP_SPOOL_BYTES)
+    if compression == 'gzip':
+        # Level 6 is most of level 9's ratio at a fraction of the CPU
+        stream = gzip.GzipFile(fileobj=spool, mode='wb', compresslevel=6)
+    elif compression == 'zstd':
+        import zstandard
+
+        stream = zstandard.ZstdCompressor(level=3).stream_writer(spool, closefd=False)
+    else:
+        stream = spool
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    df.to_csv(text, index=False)
+    text.flush()
+    text.detach()
+    if stream is not spool:
+        # Writes the compressed trailer; neither closes the spool itself
+        stream.close()
+    spool.seek(0)
+    return spool
+
+
+def _typed_setlist(df):
+    """Copy of df with the flag columns as real (nullable) booleans."""
+    import pandas as pd
+
+    df = df.copy()
+    for column in DUMP_BOOLEAN_COLUMNS:
+        if column in df.columns:
+            values = df[column]
+            if not pd.api.types.is_bool_dtype(values):
+                # Flags that went through CSV come back as 'True'/'False'
+                values = values.map(lambda v: {'true': True, 'false': False}.get(v.lower(), v)
+                                    if isinstance(v, str) else v)
+            df[column] = values.astype('boolean')
+    return df
+
+
+def write_parquet(df, compression=None):
+    """
+    Serialize a DataFrame as Parquet into a rewound binary spool file.
+
+    Args:
+        df (DataFrame): Rows to write (without the index)
+        compression (str): Parquet codec (default PARQUET_COMPRESSION)
+
+    Returns:
+        SpooledTemporaryFile: The encoded bytes; the caller closes it
+    """
+    import tempfile
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pa.Table.from_pandas(_typed_setlist(df), preserve_index=False)
+    spool = tempfile.SpooledTemporaryFile(max_size=S3_DUMP_SPOOL_BYTES)
+    pq.write_table(table, spool, compression=compression or PARQUET_COMPRESSION)
+    spool.seek(0)
+    return spool
+
+
+def upload_fileobj_to_s3(fileobj, bucket_name, file_key, s3=None, content_type=None,
+                         part_bytes=S3_UPLOAD_PART_BYTES, max_concurrency=S3_UPLOAD_MAX_CONCURRENCY):
+    """
+    Upload a binary file object, in parallel multipart chunks when it is larger than one part.
+
+    Args:
+        fileobj: Readable binary file object
+        bucket_name (str): Destination bucket
+        file_key (str): Destination key
+        s3: boto3 resource or client (defaults to the shared client)
+        content_type (str): Content-Type stored with the object
+        part_bytes (int): Multipart threshold and part size
+        max_concurrency (int): Parts uploaded at once
+    """
+    from boto3.s3.transfer import TransferConfig
+
+    config = TransferConfig(multipart_threshold=part_bytes, multipart_chunksize=part_bytes,
+                            max_concurrency=max_concurrency)
+    extra_args = {'ContentType': content_type} if content_type else None
+    _s3_client(s3).upload_fileobj(fileobj, bucket_name, file_key, ExtraArgs=extra_args, Config=config)
+
+
+def cloud_dump(setlist, args=None, dump_all=False, compression=None, file_format='csv'):
+    """
+    Upload a setlist to S3 as a timestamped CSV or Parquet file.
+
+    Args:
+        setlist (DataFrame): Songs with in_database and is_hallucination columns
+        args (dict): Generation arguments, encoded into the file name with dump_all
+        dump_all (bool): Dump every song to 'vibesets' rather than only new,
+            real ones to 'chatgpt-setlist-to-database'
+        compression (str): CSV compression, 'gzip', 'zstd' or 'none' (default
+            DUMP_COMPRESSION); Parquet files use PARQUET_COMPRESSION
+        file_format (str): 'csv', or 'parquet' for typed columns under a
+            date=YYYY-MM-DD/ partition (read back with load_parquet_from_s3)
+
+    Returns:
+        str: The object key, or None when there was nothing to dump
+    """
+    if file_format not in ('csv', 'parquet'):
+        raise ValueError(f"Unknown file_format {file_format!r}; use 'csv' or 'parquet'")
+    now = datetime.now()
+    if file_format == 'parquet':
+        directory, suffix = f"{PARTITION_PREFIX}{now:%Y-%m-%d}/", '.parquet'
+    else:
+        compression = _resolve_compression(compression or DUMP_COMPRESSION)
+        directory, suffix = '', '.csv' + _COMPRESSION_SUFFIXES[compression]
 
     # Determine bucket name and filtering based on the mode
     if dump_all and args is not None:
@@ -122,26 +892,71 @@ def cloud_dump(setlist, args=None, dump_all=False):
         data_to_dump = setlist
         # Create filename using args dictionary
         args_str = '_'.join([f"{key}-{value}" for key, value in args.items()])
-        file_name = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{args_str}.csv"
+        file_name = f"{directory}{now.strftime('%Y%m%d%H%M%S')}_{args_str}{suffix}"
     else:
         bucket_name = 'chatgpt-setlist-to-database'
         # Filter the dataframe
         data_to_dump = setlist[(setlist['in_database'] == False) & (setlist['is_hallucination'] == False)]
-        file_name = f"{datetime.now().strftime('%Y%m%d%H%M%S')}.csv"
+        file_name = f"{directory}{now.strftime('%Y%m%d%H%M%S')}{suffix}"
         if data_to_dump.empty:
             print("No songs to dump.")
             return
 
-    # Convert the DataFrame into a CSV string
-    csv_buffer = StringIO()
-    data_to_dump.to_csv(csv_buffer, index=False)
+    ensure_bucket(bucket_name)
+    if file_format == 'parquet':
+        body, content_type = write_parquet(data_to_dump), 'application/vnd.apache.parquet'
+    else:
+        body, content_type = write_csv_compressed(data_to_dump, compression), 'text/csv'
+    with body:
+        upload_fileobj_to_s3(body, bucket_name, file_name, content_type=content_type)
 
-    # Check if bucket exists; if not, create it
-    if bucket_name not in [bucket['Name'] for bucket in s3_client.list_buckets()['Buckets']]:
-        s3_client.create_bucket(Bucket=bucket_name)
-        print(f"S3 bucket {bucket_name} created.")
+    print(f"Dumped to {file_name} in S3 bucket {bucket_name}.")
+    return file_name
 
-    # Put the object (upload the file)
-    s3_resource.Object(bucket_name, file_name).put(Body=csv_buffer.getvalue())
 
-    print(f"Dumped to {file_name} in S3 bucket {bucket_name}.")
+def load_parquet_from_s3(bucket_name, columns=None, start=None, end=None, prefix='', s3=None,
+                         max_workers=S3_LOAD_MAX_WORKERS):
+    """
+    Load Parquet dumps into one DataFrame, fetching only the bytes a query needs.
+
+    Partitions outside start..end are never listed (partition pruning), and
+    from each file only the footer and the requested column chunks are read
+    with ranged GETs (column projection). The partition date comes back as a
+    'date' column.
+
+    Args:
+        bucket_name (str): Bucket the dumps were written to
+        columns (List[str]): Columns to read (default all); may include 'date'
+        start, end (datetime | date | str): Inclusive dump time range
+        prefix (str): Key prefix above the date= partitions
+        s3: boto3 resource or client (defaults to the shared client)
+        max_workers (int): Files read at once
+
+    Returns:
+        DataFrame: Matching rows (empty when no file matched)
+    """
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    client = _s3_client(s3)
+    keys = sorted(list_s3_keys(bucket_name, client, prefix=prefix, start=start, end=end, suffix='.parquet',
+                               max_workers=max_workers, partitioned=True))
+    file_columns = None if columns is None else [c for c in columns if c != 'date']
+
+    def load(key):
+        with _RangedObjectReader(client, bucket_name, key, prefetch=False) as f:
+            table = pq.ParquetFile(f, pre_buffer=True).read(columns=file_columns)
+        if columns is None or 'date' in columns:
+            day = date.fromisoformat(key[len(prefix) + len(PARTITION_PREFIX):].split('/', 1)[0])
+            table = table.append_column('date', pa.array([day] * table.num_rows, pa.date32()))
+        return table
+
+    if not keys:
+        return pd.DataFrame(columns=columns or [])
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(keys)), thread_name_prefix="s3-parquet") as pool:
+        tables = list(pool.map(load, keys))
+    # Dumps written with different columns still combine; missing ones become null
+    table = pa.concat_tables(tables, promote_options='default')
+    frame = table.to_pandas()
+    return frame if columns is None else frame[list(columns)]
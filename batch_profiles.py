@@ -0,0 +1,185 @@
+"""
+Bulk profile analysis over a corpus of transcripts.
+
+Reads transcripts (*.txt) from a local directory or an S3 prefix, runs
+analyze_profile on them with bounded concurrency and appends one JSON line per
+transcript to the output file. The output file doubles as the checkpoint: on
+restart, transcripts that already have a successful line are skipped, so a
+crashed or interrupted run resumes where it stopped and failed ones are retried.
+
+Usage:
+    python batch_profiles.py transcripts/ -o profiles.jsonl --concurrency 8
+    python batch_profiles.py s3://my-bucket/transcripts/ -o profiles.jsonl
+"""
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, Iterator, Set, Tuple
+import argparse
+import json
+import os
+import time
+
+
+def iter_local_transcripts(directory: str, suffix: str = ".txt") -> Iterator[Tuple[str, Callable[[], str]]]:
+    """Yield (transcript_id, loader) for every transcript file under directory."""
+    for root, _, files in os.walk(directory):
+        for file_name in sorted(files):
+            if file_name.endswith(suffix):
+                path = os.path.join(root, file_name)
+                transcript_id = os.path.relpath(path, directory)
+
+                def load(path=path):
+                    with open(path, encoding="utf-8") as f:
+                        return f.read()
+                yield transcript_id, load
+
+
+def iter_s3_transcripts(uri: str, suffix: str = ".txt") -> Iterator[Tuple[str, Callable[[], str]]]:
+    """Yield (transcript_id, loader) for every transcript object under an s3://bucket/prefix URI."""
+    from aws_utils import connect_to_s3, list_s3_keys
+
+    bucket_name, _, prefix = uri[len("s3://"):].partition("/")
+    client = connect_to_s3(client=True)
+    for key in list_s3_keys(bucket_name, client, prefix=prefix, suffix=suffix):
+        def load(key=key):
+            body = client.get_object(Bucket=bucket_name, Key=key)["Body"]
+            return body.read().decode("utf-8")
+        yield key, load
+
+
+def load_checkpoint(output_path: str) -> Set[str]:
+    """Ids that already have a successful result in the output file."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line cut short by a crash; that transcript is simply redone
+                continue
+            if record.get("status") == "ok":
+                done.add(record["id"])
+    return done
+
+
+def analyze_one(transcript_id: str, load: Callable[[], str], model: str, use_cache: bool,
+                split: bool = False) -> Dict:
+    from veer_client_utils import analyze_profile
+
+    started = time.perf_counter()
+    usage = {}
+    try:
+        transcript = load()
+        profile = analyze_profile(transcript, model=model, use_cache=use_cache, on_usage=usage.update,
+                                  split=split)
+    except Exception as e:
+        profile = {"error": f"Could not load or analyze transcript: {e}"}
+    return {
+        "id": transcript_id,
+        "status": "error" if "error" in profile else "ok",
+        "error": profile.get("error"),
+        "profile": None if "error" in profile else profile,
+        "usage": usage or None,
+        "elapsed": time.perf_counter() - started,
+    }
+
+
+def run_batch(source: str, output_path: str, concurrency: int = 8, model: str = "o4-mini",
+              use_cache: bool = True, limit: int = None, split: bool = False) -> Dict:
+    """
+    Analyze every transcript in source that is not already in the output file.
+
+    Args:
+        source: Local directory or s3://bucket/prefix
+        output_path: JSON Lines file that receives results and acts as the checkpoint
+        concurrency: Maximum number of analyze_profile calls in flight
+        model: Model passed to analyze_profile
+        use_cache: Let analyze_profile reuse cached responses
+        limit: Stop after this many new transcripts (for trial runs)
+        split: Generate each profile as concurrent per-part calls (see analyze_profile_split)
+
+    Returns:
+        Dict: Run summary (counts, throughput, token usage, failed ids)
+    """
+    transcripts = iter_s3_transcripts(source) if source.startswith("s3://") else iter_local_transcripts(source)
+    done = load_checkpoint(output_path)
+    summary = {"processed": 0, "succeeded": 0, "failed": 0, "skipped": 0, "cached": 0,
+               "prompt_tokens": 0, "completion_tokens": 0, "failed_ids": []}
+    started = time.perf_counter()
+
+    with open(output_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        in_flight = set()
+
+        def drain(return_when):
+            nonlocal in_flight
+            finished, in_flight = wait(in_flight, return_when=return_when)
+            for future in finished:
+                record = future.result()
+                # One line per transcript, flushed immediately so a crash loses at most the calls in flight
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+                os.fsync(out.fileno())
+
+                summary["processed"] += 1
+                usage = record["usage"] or {}
+                summary["prompt_tokens"] += usage.get("prompt_tokens") or 0
+                summary["completion_tokens"] += usage.get("completion_tokens") or 0
+                summary["cached"] += bool(usage.get("cached"))
+                if record["status"] == "ok":
+                    summary["succeeded"] += 1
+                else:
+                    summary["failed"] += 1
+                    summary["failed_ids"].append(record["id"])
+                    print(f"Failed: {record['id']}: {record['error']}")
+                if summary["processed"] % 10 == 0:
+                    print(f"{summary['processed']} processed ({summary['failed']} failed)")
+
+        submitted = 0
+        for transcript_id, load in transcripts:
+            if transcript_id in done:
+                summary["skipped"] += 1
+                continue
+            if limit is not None and submitted >= limit:
+                break
+            # Keep the queue short so huge corpora are not all loaded up front
+            if len(in_flight) >= 2 * concurrency:
+                drain(FIRST_COMPLETED)
+            in_flight.add(pool.submit(analyze_one, transcript_id, load, model, use_cache, split))
+            submitted += 1
+        while in_flight:
+            drain(FIRST_COMPLETED)
+
+    elapsed = time.perf_counter() - started
+    summary["elapsed_seconds"] = elapsed
+    summary["profiles_per_minute"] = summary["processed"] / elapsed * 60 if elapsed else 0.0
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run analyze_profile over a directory or S3 prefix of transcripts.")
+    parser.add_argument("source", help="Local directory or s3://bucket/prefix containing .txt transcripts")
+    parser.add_argument("-o", "--output", default="profiles.jsonl", help="JSON Lines output (also the resume checkpoint)")
+    parser.add_argument("-c", "--concurrency", type=int, default=8, help="Analyses in flight at once")
+    parser.add_argument("-m", "--model", default="o4-mini", help="Model for analyze_profile")
+    parser.add_argument("--no-cache", action="store_true", help="Always call the API, even for cached requests")
+    parser.add_argument("--limit", type=int, default=None, help="Only process this many new transcripts")
+    parser.add_argument("--split", action="store_true", help="Generate profile parts with concurrent calls")
+    args = parser.parse_args()
+
+    summary = run_batch(args.source, args.output, concurrency=args.concurrency, model=args.model,
+                        use_cache=not args.no_cache, limit=args.limit, split=args.split)
+
+    print("\nBatch complete")
+    print(f"  Processed:   {summary['processed']} ({summary['succeeded']} ok, {summary['failed']} failed, "
+          f"{summary['skipped']} already done, {summary['cached']} from cache)")
+    print(f"  Throughput:  {summary['profiles_per_minute']:.1f} profiles/min over {summary['elapsed_seconds']:.1f}s")
+    print(f"  Tokens:      {summary['prompt_tokens']} prompt, {summary['completion_tokens']} completion")
+    if summary["failed_ids"]:
+        print("  Failed ids (rerun to retry):")
+        for transcript_id in summary["failed_ids"]:
+            print(f"    {transcript_id}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,1258 @@
-from azure.ai.inference import ChatCompletionsClient
-from azure.core.credentials import AzureKeyCredential
-from azure.ai.inference import EmbeddingsClient
-import google.generativeai as genai
+from typing import TYPE_CHECKING, Union, List
+import asyncio
+import atexit
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import random
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 
-from typing import Union, List
-from openai import OpenAI, AzureOpenAI
-import numpy as np
 
+from aws_utils import get_secret, invalidate_secret
 
-from aws_utils import get_secret
+# Provider SDKs and numpy are imported where they are first needed, so importing
+# this module (and every Streamlit worker start) stays cheap
+if TYPE_CHECKING:
+    import numpy as np
 
 DEFAULT_OAI_MODEL = 'gpt-4.1'
+AZURE_SECRET_NAME = 'vibeset/azure_ai_foundry'
+MERCURY_SECRET_NAME = 'vibeset/mercury'
+MERCURY_BASE_URL = "https://api.inceptionlabs.ai/v1"
+
+
+def _is_auth_error(e: Exception) -> bool:
+    """True if a provider SDK error is an HTTP 401 (azure-core and openai both expose status_code)."""
+    return getattr(e, 'status_code', None) == 401
+
+
+def _with_secret_retry(secret_name: str, call):
+    """Run call(); on a 401 drop the cached secret and try once more with a fresh one."""
+    try:
+        return call()
+    except Exception as e:
+        if not _is_auth_error(e):
+            raise
+        print(f"Authentication failed, refreshing secret {secret_name}: {e}")
+        invalidate_secret(secret_name)
+        return call()
+
+
+async def _with_secret_retry_async(secret_name: str, call):
+    """Async version of _with_secret_retry; call is a coroutine function."""
+    try:
+        return await call()
+    except Exception as e:
+        if not _is_auth_error(e):
+            raise
+        print(f"Authentication failed, refreshing secret {secret_name}: {e}")
+        invalidate_secret(secret_name)
+        return await call()
+
+
+# ── Client registry ────────────────────────────────────────────────────────
+# One long-lived SDK client per (kind, endpoint, api_version, credential), shared
+# by every gai_client instance and every Streamlit session in the process, so
+# repeat calls reuse warm keep-alive connections instead of a new TLS handshake.
+HTTP_POOL_MAXSIZE = int(os.getenv('GAI_HTTP_POOL_MAXSIZE', 20))
+# How long a client replaced after a key rotation stays open for the calls
+# already running on it; longer than a whole call (see CALL_DEADLINE_SECONDS)
+RETIRED_CLIENT_GRACE_SECONDS = float(os.getenv('GAI_RETIRED_CLIENT_GRACE_SECONDS', 600))
+
+_client_registry = {}  # (kind, endpoint, api_version) -> (api_key, client)
+_retired_clients = []
+_client_registry_lock = threading.Lock()
+
+
+def _azure_transport():
+    """A requests-based transport whose connection pool is sized for concurrent use."""
+    import requests
+    from azure.core.pipeline.transport import RequestsTransport
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=HTTP_POOL_MAXSIZE,
+                                            pool_maxsize=HTTP_POOL_MAXSIZE)
+    session.mount('https://', adapter)
+    return RequestsTransport(session=session, session_owner=True)
+
+
+def _build_client(kind: str, endpoint: str, api_key: str, api_version: str = None):
+    from azure.core.credentials import AzureKeyCredential
+
+    if kind == 'chat':
+        from azure.ai.inference import ChatCompletionsClient
+        return ChatCompletionsClient(
+            endpoint=endpoint,
+            credential=AzureKeyCredential(api_key),
+            api_version=api_version,
+            transport=_azure_transport()
+        )
+    if kind == 'embeddings':
+        from azure.ai.inference import EmbeddingsClient
+        return EmbeddingsClient(
+            endpoint=endpoint,
+            credential=AzureKeyCredential(api_key),
+            transport=_azure_transport()
+        )
+    if kind == 'azure_openai':
+        from openai import AzureOpenAI
+        return AzureOpenAI(
+            api_version=api_version,
+            azure_endpoint=endpoint,
+            api_key=api_key,
+        )
+    if kind == 'openai':
+        from openai import OpenAI
+        return OpenAI(api_key=api_key, base_url=endpoint)
+    raise ValueError(f"Unknown client kind: {kind}")
+
+
+def get_client(kind: str, endpoint: str, api_key: str, api_version: str = None):
+    """
+    Return the shared client for an endpoint, building it on first use.
+
+    kind is one of 'chat' (azure ChatCompletionsClient), 'embeddings' (azure
+    EmbeddingsClient), 'azure_openai' (AzureOpenAI) or 'openai' (OpenAI with a
+    custom base_url). When the key for an endpoint changes (secret rotation) a
+    new client is built; the old one is closed RETIRED_CLIENT_GRACE_SECONDS
+    later, once the calls already running on it have finished.
+    """
+    registry_key = (kind, endpoint, api_version)
+    entry = _client_registry.get(registry_key)
+    if entry is not None and entry[0] == api_key:
+        return entry[1]
+
+    with _client_registry_lock:
+        entry = _client_registry.get(registry_key)
+        if entry is not None and entry[0] == api_key:
+            return entry[1]
+        client = _build_client(kind, endpoint, api_key, api_version)
+        if entry is not None:
+            _retired_clients.append(entry[1])
+            timer = threading.Timer(RETIRED_CLIENT_GRACE_SECONDS, _close_retired_client, [entry[1]])
+            timer.daemon = True
+            timer.start()
+        _client_registry[registry_key] = (api_key, client)
+        return client
+
+
+def _close_client(client):
+    try:
+        client.close()
+    except Exception as e:
+        print(f"Error closing client: {e}")
+
+
+def _close_retired_client(client):
+    """Close a client replaced by get_client, unless close_clients already did."""
+    with _client_registry_lock:
+        if not any(c is client for c in _retired_clients):
+            return
+        _retired_clients[:] = [c for c in _retired_clients if c is not client]
+    _close_client(client)
+
+
+def close_clients():
+    """Close every pooled client; called automatically at interpreter exit."""
+    with _client_registry_lock:
+        clients = [client for _, client in _client_registry.values()] + _retired_clients
+        _client_registry.clear()
+        _retired_clients.clear()
+    for client in clients:
+        _close_client(client)
+
+
+atexit.register(close_clients)
+
+
+# Async clients hold loop-bound connection pools, so they are registered per
+# event loop and dropped together with the loop.
+_async_client_registry = weakref.WeakKeyDictionary()  # loop -> {key: (api_key, client)}
+_retired_async_clients = weakref.WeakKeyDictionary()  # loop -> [client]
+_closing_async_clients = set()  # close tasks in flight, kept so they are not collected
+
+
+def _build_async_client(kind: str, endpoint: str, api_key: str, api_version: str = None):
+    from azure.core.credentials import AzureKeyCredential
+
+    if kind == 'chat':
+        from azure.ai.inference.aio import ChatCompletionsClient as AsyncChatCompletionsClient
+        return AsyncChatCompletionsClient(
+            endpoint=endpoint,
+            credential=AzureKeyCredential(api_key),
+            api_version=api_version
+        )
+    if kind == 'embeddings':
+        from azure.ai.inference.aio import EmbeddingsClient as AsyncEmbeddingsClient
+        return AsyncEmbeddingsClient(
+            endpoint=endpoint,
+            credential=AzureKeyCredential(api_key)
+        )
+    if kind == 'azure_openai':
+        from openai import AsyncAzureOpenAI
+        return AsyncAzureOpenAI(
+            api_version=api_version,
+            azure_endpoint=endpoint,
+            api_key=api_key,
+        )
+    if kind == 'openai':
+        from openai import AsyncOpenAI
+        return AsyncOpenAI(api_key=api_key, base_url=endpoint)
+    raise ValueError(f"Unknown client kind: {kind}")
+
+
+def get_async_client(kind: str, endpoint: str, api_key: str, api_version: str = None):
+    """
+    Async counterpart of get_client, shared by all coroutines on the running loop.
+
+    A client replaced after a key rotation is closed on its loop
+    RETIRED_CLIENT_GRACE_SECONDS later, or by close_async_clients.
+    """
+    loop = asyncio.get_running_loop()
+    with _client_registry_lock:
+        clients = _async_client_registry.setdefault(loop, {})
+        registry_key = (kind, endpoint, api_version)
+        entry = clients.get(registry_key)
+        if entry is not None and entry[0] == api_key:
+            return entry[1]
+        client = _build_async_client(kind, endpoint, api_key, api_version)
+        if entry is not None:
+            _retired_async_clients.setdefault(loop, []).append(entry[1])
+            loop.call_later(RETIRED_CLIENT_GRACE_SECONDS, _close_retired_async_client, loop, entry[1])
+        clients[registry_key] = (api_key, client)
+        return client
+
+
+async def _close_async_client(client):
+    try:
+        await client.close()
+    except Exception as e:
+        print(f"Error closing client: {e}")
+
+
+def _close_retired_async_client(loop, client):
+    """Close a client replaced by get_async_client, unless close_async_clients already did."""
+    with _client_registry_lock:
+        retired = _retired_async_clients.get(loop, [])
+        if not any(c is client for c in retired):
+            return
+        retired[:] = [c for c in retired if c is not client]
+    task = loop.create_task(_close_async_client(client))
+    _closing_async_clients.add(task)
+    task.add_done_callback(_closing_async_clients.discard)
+
+
+async def close_async_clients():
+    """Close the async clients registered on the running loop; await before the loop ends."""
+    loop = asyncio.get_running_loop()
+    with _client_registry_lock:
+        clients = [client for _, client in _async_client_registry.pop(loop, {}).values()]
+        clients += _retired_async_clients.pop(loop, [])
+    for client in clients:
+        await _close_async_client(client)
+
+
+class TextStream:
+    """
+    Iterator over the text deltas of a streamed completion.
+
+    Iterating yields str chunks as they arrive. Once the stream is exhausted,
+    .text holds the full response and .usage a dict with the provider's token
+    counts (None where the provider did not report them), the prompt tokens
+    served from the provider's prompt cache (cached_prompt_tokens), plus
+    time_to_first_token and elapsed seconds. Iterating again replays .text
+    as one delta instead of reading the spent response.
+    """
+
+    def __init__(self, chunks, started: float = None, on_complete=None):
+        self._chunks = chunks
+        self._started = started if started is not None else time.perf_counter()
+        self._on_complete = on_complete
+        self._on_close = []
+        self._closed = False
+        self._consumed = False
+        self._cached_text = None
+        self.text = ""
+        self.usage = None
+
+    @classmethod
+    def from_text(cls, text: str):
+        """A stream that replays an already known (cached) response as one delta."""
+        stream = cls(chunks=())
+        stream._cached_text = text
+        return stream
+
+    def __iter__(self):
+        if self._cached_text is not None:
+            yield self._cached_text
+            self.text = self._cached_text
+            self.usage = {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0,
+                          'cached_prompt_tokens': 0, 'time_to_first_token': 0.0, 'elapsed': 0.0,
+                          'cached': True}
+            return
+        if self._consumed:
+            if self.text:
+                yield self.text
+            return
+        self._consumed = True
+
+        parts = []
+        usage = None
+        first_token_at = None
+        completed = False
+        try:
+            for chunk in self._chunks:
+                if getattr(chunk, 'usage', None):
+                    usage = chunk.usage
+                for choice in chunk.choices or []:
+                    delta = getattr(choice.delta, 'content', None) if choice.delta else None
+                    if delta:
+                        if first_token_at is None:
+                            first_token_at = time.perf_counter()
+                        parts.append(delta)
+                        yield delta
+            completed = True
+        finally:
+            self.text = "".join(parts)
+            self.usage = {
+                'prompt_tokens': getattr(usage, 'prompt_tokens', None),
+                'completion_tokens': getattr(usage, 'completion_tokens', None),
+                'total_tokens': getattr(usage, 'total_tokens', None),
+                'cached_prompt_tokens': _cached_prompt_tokens(usage),
+                'time_to_first_token': (first_token_at - self._started) if first_token_at else None,
+                'elapsed': time.perf_counter() - self._started,
+                'cached': False,
+            }
+            self.close()
+        if completed and self._on_complete is not None:
+            self._on_complete(self.text)
+
+    def add_close_callback(self, callback):
+        """Call callback(usage) once the stream is finished, closed, or garbage collected unread."""
+        self._on_close.append(callback)
+
+    def close(self):
+        """Release the underlying response; needed for a stream that is not iterated to the end."""
+        if self._closed:
+            return
+        self._closed = True
+        close = getattr(self._chunks, 'close', None)
+        if close is not None:
+            close()
+        for callback in self._on_close:
+            callback(self.usage)
+
+    def __del__(self):
+        # A stream dropped without being read to the end or closed would
+        # otherwise keep its rate-limit slot (and its connection) forever
+        if not getattr(self, '_closed', True):
+            self.close()
+
+
+# ── Response cache ─────────────────────────────────────────────────────────
+# Completions keyed by a hash of everything that determines the output, kept in
+# a local sqlite file. Entries expire after a TTL and the least recently used
+# ones are evicted once the store grows past max_bytes.
+RESPONSE_CACHE_DIR = os.getenv('GAI_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'veer'))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv('GAI_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv('GAI_CACHE_TTL_SECONDS', 7 * 24 * 3600))
+
+
+def _schema_fingerprint(json_schema) -> str:
+    """Stable JSON text for a schema given as a dict or an azure JsonSchemaFormat."""
+    if json_schema is None:
+        return ""
+    if hasattr(json_schema, 'as_dict'):
+        json_schema = json_schema.as_dict()
+    return json.dumps(json_schema, sort_keys=True, default=str)
+
+
+def response_cache_key(model: str, sysmsg: str, json_schema, temperature: float, prompt: str) -> str:
+    """Content hash identifying a completion request."""
+    payload = json.dumps([model, sysmsg or "", _schema_fingerprint(json_schema), temperature, prompt])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _rollback(conn):
+    """Undo a half-written cache transaction, if the connection got that far."""
+    if conn is None:
+        return
+    try:
+        conn.rollback()
+    except sqlite3.Error:
+        pass
+
+
+class ResponseCache:
+    """
+    Disk-backed, size-bounded LRU cache of completion texts with a TTL.
+
+    The cache is optional: if its file cannot be opened or written (a bad
+    GAI_CACHE_DIR, another process holding the lock) a lookup counts as a miss
+    and a store is skipped, so the model call itself still goes through.
+    """
+
+    def __init__(self,
+                 path: str = None,
+                 max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+                 ttl: float = RESPONSE_CACHE_TTL_SECONDS):
+        self.path = path or os.path.join(RESPONSE_CACHE_DIR, 'responses.sqlite3')
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._conn = None
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'errors': 0}
+
+    def _connection(self):
+        # Opened lazily so importing gai_utils never touches the disk
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT, size INTEGER, created REAL, accessed REAL)"
+            )
+        return self._conn
+
+    def get(self, key: str):
+        """Return the cached text for key, or None on a miss or expired entry."""
+        now = time.time()
+        with self._lock:
+            try:
+                conn = self._connection()
+                row = conn.execute(
+                    "SELECT value FROM responses WHERE key = ? AND created > ?", (key, now - self.ttl)
+                ).fetchone()
+            except (sqlite3.Error, OSError) as e:
+                self._failed(e)
+                row = None
+            if row is None:
+                self._stats['misses'] += 1
+                return None
+            try:
+                conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                conn.commit()
+            except sqlite3.Error as e:
+                # Only the LRU order suffers; the hit is still good
+                self._failed(e)
+            self._stats['hits'] += 1
+            return row[0]
+
+    def put(self, key: str, value: str):
+        """Store value under key; skipped (and logged) if the cache file is unusable."""
+        now = time.time()
+        size = len(value.encode('utf-8'))
+        with self._lock:
+            try:
+                conn = self._connection()
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                    (key, value, size, now, now)
+                )
+                self._evict(conn, now)
+                conn.commit()
+            except (sqlite3.Error, OSError) as e:
+                self._failed(e)
+                return
+            self._stats['stores'] += 1
+
+    def _failed(self, error: Exception):
+        self._stats['errors'] += 1
+        print(f"Response cache unavailable ({self.path}): {error}")
+        _rollback(self._conn)
+
+    def _evict(self, conn, now: float):
+        expired = conn.execute("DELETE FROM responses WHERE created <= ?", (now - self.ttl,)).rowcount
+        self._stats['evictions'] += max(expired, 0)
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            self._stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM responses")
+            conn.commit()
+
+    def stats(self) -> dict:
+        """Hit/miss/store/eviction counters for this process, plus the hit rate."""
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+
+response_cache = ResponseCache()
+
+
+# ── Embedding pipeline ─────────────────────────────────────────────────────
+# Inputs are deduplicated, looked up in a persistent float32 store keyed by
+# (model, text hash), and only the missing texts are sent to the provider in
+# provider-sized batches, several batches in flight at once.
+EMBEDDING_BATCH_SIZES = {
+    "Cohere-embed-v3-multilingual": 96,
+    "text-embedding-3-small": 2048,
+}
+DEFAULT_EMBEDDING_BATCH_SIZE = 96
+EMBEDDING_MAX_WORKERS = int(os.getenv('GAI_EMBEDDING_MAX_WORKERS', 4))
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _batches(items: list, size: int) -> list:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+class EmbeddingStore:
+    """
+    Persistent float32 embeddings keyed by (model, sha256 of the text).
+
+    Like ResponseCache it is optional: when its file is unusable, lookups find
+    nothing and stores are skipped.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or os.path.join(RESPONSE_CACHE_DIR, 'embeddings.sqlite3')
+        self._conn = None
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'errors': 0}
+
+    def _connection(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT, text_hash TEXT, vector BLOB, PRIMARY KEY (model, text_hash))"
+            )
+        return self._conn
+
+    def get_many(self, model: str, texts: List[str]) -> dict:
+        """Return {text: vector} for the texts already stored for model."""
+        import numpy as np
+
+        hashes = {_text_hash(t): t for t in texts}
+        found = {}
+        with self._lock:
+            try:
+                conn = self._connection()
+                # Stay well under sqlite's bound-parameter limit
+                for chunk in _batches(list(hashes), 500):
+                    placeholders = ",".join("?" * len(chunk))
+                    rows = conn.execute(
+                        f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                        [model, *chunk]
+                    ).fetchall()
+                    for text_hash, blob in rows:
+                        found[hashes[text_hash]] = np.frombuffer(blob, dtype=np.float32)
+            except (sqlite3.Error, OSError) as e:
+                self._failed(e)
+                found = {}
+            self._stats['hits'] += len(found)
+            self._stats['misses'] += len(hashes) - len(found)
+        return found
+
+    def put_many(self, model: str, texts: List[str], vectors: "np.ndarray"):
+        import numpy as np
+
+        rows = [(model, _text_hash(t), np.asarray(v, dtype=np.float32).tobytes())
+                for t, v in zip(texts, vectors)]
+        with self._lock:
+            try:
+                conn = self._connection()
+                conn.executemany("INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                                 rows)
+                conn.commit()
+            except (sqlite3.Error, OSError) as e:
+                self._failed(e)
+                return
+            self._stats['stores'] += len(rows)
+
+    def _failed(self, error: Exception):
+        self._stats['errors'] += 1
+        print(f"Embedding store unavailable ({self.path}): {error}")
+        _rollback(self._conn)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+
+embedding_store = EmbeddingStore()
+
+
+# ── Token accounting ───────────────────────────────────────────────────────
+# Exact counts need tiktoken (optional); without it they are estimated from
+# the character count. Azure caches a prompt's prefix once it is at least
+# PROMPT_CACHE_MIN_TOKENS long and byte-identical to a recent request's, which
+# is why system messages should be static and anything per-call goes last.
+# Rough English average; Azure's own rate-limit pre-check also estimates from characters
+CHARS_PER_TOKEN = 4
+PROMPT_CACHE_MIN_TOKENS = 1024
+
+_token_encoding = None
+
+
+def _encoding():
+    """The o200k_base tokenizer used by the gpt-4o/4.1/o4 families, or False without tiktoken."""
+    global _token_encoding
+    if _token_encoding is None:
+        try:
+            import tiktoken
+            _token_encoding = tiktoken.get_encoding('o200k_base')
+        except ImportError:
+            _token_encoding = False
+    return _token_encoding
+
+
+def count_tokens(text: str) -> int:
+    """Tokens in text (exact with tiktoken installed, estimated otherwise)."""
+    if not text:
+        return 0
+    encoding = _encoding()
+    if encoding:
+        return len(encoding.encode(text))
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def prompt_token_report(prompt: str, sysmsg: str = None, json_schema=None) -> dict:
+    """
+    Break down the prompt tokens of a chat request.
+
+    Returns:
+        dict: system, schema and user token counts, their total, the static
+        prefix (system message plus schema, identical on every call), whether
+        that prefix is long enough for Azure's prompt cache, and whether the
+        counts are exact
+    """
+    system = count_tokens(sysmsg)
+    schema = count_tokens(_schema_fingerprint(json_schema))
+    user = count_tokens(prompt)
+    return {
+        'system': system,
+        'schema': schema,
+        'user': user,
+        'total': system + schema + user,
+        'static_prefix': system + schema,
+        'cacheable': system + schema >= PROMPT_CACHE_MIN_TOKENS,
+        'exact': bool(_encoding()),
+    }
+
+
+def _cached_prompt_tokens(usage):
+    """usage.prompt_tokens_details.cached_tokens from an openai or azure usage object, if reported."""
+    details = getattr(usage, 'prompt_tokens_details', None)
+    if details is None and hasattr(usage, 'get'):
+        # azure-ai-inference models keep fields they do not declare as dict items
+        details = usage.get('prompt_tokens_details')
+    if isinstance(details, dict):
+        return details.get('cached_tokens')
+    return getattr(details, 'cached_tokens', None)
+
+
+# ── Rate limiting ──────────────────────────────────────────────────────────
+# Azure meters every deployment in requests and tokens per minute, charging a
+# request its prompt tokens plus max_tokens as soon as it is accepted. For a
+# deployment whose quota is configured, calls wait here until both budgets have
+# room rather than being sent into a 429; without one only the cap below and
+# the service's own 429s apply. The number of calls in flight per deployment is
+# capped as well, and the cap adapts: it halves on a 429 (and the deployment
+# pauses for the retry-after the service asked for) and grows back by one for
+# every cap's worth of successes.
+# Deployment name -> (requests per minute, tokens per minute), e.g.
+# GAI_RATE_LIMITS='{"o4-mini": [100, 100000]}'; a deployment's own rate_limit
+# (see MODEL_DEPLOYMENTS) takes precedence
+DEPLOYMENT_RATE_LIMITS = {name: tuple(limits) for name, limits
+                          in json.loads(os.getenv('GAI_RATE_LIMITS') or '{}').items()}
+RATE_LIMIT_MAX_CONCURRENCY = int(os.getenv('GAI_RATE_LIMIT_MAX_CONCURRENCY', 16))
+RATE_LIMIT_MAX_RETRIES = int(os.getenv('GAI_RATE_LIMIT_MAX_RETRIES', 3))
+RATE_LIMIT_MAX_WAIT_SECONDS = float(os.getenv('GAI_RATE_LIMIT_MAX_WAIT_SECONDS', 120))
+# How often a waiting coroutine re-checks a deployment that is at its concurrency cap
+_RATE_LIMIT_POLL_SECONDS = 0.05
+
+
+class NoCapacityError(TimeoutError):
+    """A deployment's rate limiter had no room for the request within the allowed wait."""
+
+
+def estimate_request_tokens(request: dict, max_tokens: int) -> int:
+    """Tokens a chat request will be charged up front: its prompt (estimated) plus max_tokens."""
+    chars = sum(len(str(m.get('content') or '')) for m in request.get('messages', []))
+    chars += len(_schema_fingerprint(request.get('response_format')))
+    return chars // CHARS_PER_TOKEN + (max_tokens or 0)
+
+
+def _retry_after(e: Exception):
+    """Seconds the service asked us to wait in a 429's headers, if it said."""
+    headers = getattr(getattr(e, 'response', None), 'headers', None) or {}
+    for name, scale in (('retry-after-ms', 0.001), ('x-ms-retry-after-ms', 0.001), ('retry-after', 1.0)):
+        value = headers.get(name)
+        if value:
+            try:
+                return float(value) * scale
+            except ValueError:
+                # HTTP-date form; fall through to the default pause
+                pass
+    return None
+
+
+class DeploymentRateLimiter:
+    """
+    Request and token buckets plus an adaptive concurrency cap for one deployment.
+
+    A None quota turns that bucket off, leaving the concurrency cap and 429
+    handling to keep the deployment in check.
+    """
+
+    def __init__(self,
+                 name: str,
+                 requests_per_minute: float = None,
+                 tokens_per_minute: float = None,
+                 max_concurrency: int = RATE_LIMIT_MAX_CONCURRENCY):
+        self.name = name
+        self.requests_per_minute = float(requests_per_minute) if requests_per_minute else None
+        self.tokens_per_minute = float(tokens_per_minute) if tokens_per_minute else None
+        self.max_concurrency = max_concurrency
+        self.concurrency = float(max_concurrency)
+        self._request_budget = self.requests_per_minute or 0.0
+        self._token_budget = self.tokens_per_minute or 0.0
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._stats = {'requests': 0, 'throttled': 0, 'waited_seconds': 0.0}
+
+    def _refill(self, now: float):
+        elapsed = now - self._refilled_at
+        self._refilled_at = now
+        if self.requests_per_minute:
+            self._request_budget = min(self.requests_per_minute,
+                                       self._request_budget + elapsed * self.requests_per_minute / 60)
+        if self.tokens_per_minute:
+            self._token_budget = min(self.tokens_per_minute,
+                                     self._token_budget + elapsed * self.tokens_per_minute / 60)
+
+    def _try_acquire(self, tokens: int):
+        """Take a slot and budget and return None, or return the seconds worth waiting first."""
+        now = time.monotonic()
+        self._refill(now)
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self._in_flight >= int(self.concurrency):
+            return _RATE_LIMIT_POLL_SECONDS
+        wait = 0.0
+        if self.requests_per_minute:
+            wait = (1 - self._request_budget) * 60 / self.requests_per_minute
+        if self.tokens_per_minute:
+            # A request bigger than the whole bucket would otherwise wait forever
+            tokens = min(tokens, self.tokens_per_minute)
+            wait = max(wait, (tokens - self._token_budget) * 60 / self.tokens_per_minute)
+        if wait > 0:
+            return wait
+        if self.requests_per_minute:
+            self._request_budget -= 1
+        if self.tokens_per_minute:
+            self._token_budget -= tokens
+        self._in_flight += 1
+        self._stats['requests'] += 1
+        return None
+
+    def acquire(self, tokens: int, timeout: float = RATE_LIMIT_MAX_WAIT_SECONDS):
+        """Block until the deployment has room for a request of this many tokens."""
+        started = time.monotonic()
+        with self._cond:
+            while True:
+                wait = self._try_acquire(tokens)
+                if wait is None:
+                    self._stats['waited_seconds'] += time.monotonic() - started
+                    return
+                remaining = started + timeout - time.monotonic()
+                if remaining <= 0:
+                    raise NoCapacityError(f"No capacity on deployment {self.name} after {timeout:.0f}s")
+                # Woken early by release() when a slot frees up
+                self._cond.wait(min(wait, remaining))
+
+    async def acquire_async(self, tokens: int, timeout: float = RATE_LIMIT_MAX_WAIT_SECONDS):
+        """Async version of acquire; waits with asyncio.sleep instead of blocking the loop."""
+        started = time.monotonic()
+        while True:
+            with self._cond:
+                wait = self._try_acquire(tokens)
+                if wait is None:
+                    self._stats['waited_seconds'] += time.monotonic() - started
+                    return
+            remaining = started + timeout - time.monotonic()
+            if remaining <= 0:
+                raise NoCapacityError(f"No capacity on deployment {self.name} after {timeout:.0f}s")
+            await asyncio.sleep(min(wait, remaining, 1.0))
+
+    def release(self, tokens: int, tokens_used: int = None, throttled: bool = False,
+                failed: bool = False, retry_after: float = None):
+        """
+        Return a slot taken by acquire and feed the outcome back into the limits.
+
+        Args:
+            tokens: The estimate the slot was acquired with
+            tokens_used: Tokens the response actually reported; the unused part
+                of the estimate goes back into the bucket
+            throttled: The call got a 429
+            failed: The call failed for another reason (the limits are left alone)
+            retry_after: Seconds the 429 asked us to wait
+        """
+        with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            self._in_flight -= 1
+            if throttled:
+                self._stats['throttled'] += 1
+                self.concurrency = max(1.0, self.concurrency / 2)
+                self._paused_until = max(self._paused_until, now + (retry_after or 1.0))
+                # Our estimate was evidently too generous; start the bucket over
+                self._token_budget = min(self._token_budget, 0.0)
+            elif not failed:
+                self.concurrency = min(float(self.max_concurrency), self.concurrency + 1 / self.concurrency)
+                if self.tokens_per_minute and tokens_used is not None and tokens_used < tokens:
+                    self._token_budget = min(self.tokens_per_minute, self._token_budget + tokens - tokens_used)
+            self._cond.notify_all()
+
+    def run(self, tokens: int, call, timeout: float = RATE_LIMIT_MAX_WAIT_SECONDS):
+        """
+        Run call() inside a slot, retrying after the requested pause when it gets a 429.
+
+        If call returns a TextStream the slot is held until the stream is
+        finished or closed. timeout bounds each wait for a slot.
+        """
+        for attempt in range(RATE_LIMIT_MAX_RETRIES + 1):
+            self.acquire(tokens, timeout)
+            try:
+                result = call()
+            except Exception as e:
+                throttled = getattr(e, 'status_code', None) == 429
+                self.release(tokens, throttled=throttled, failed=not throttled,
+                             retry_after=_retry_after(e) if throttled else None)
+                if throttled and attempt < RATE_LIMIT_MAX_RETRIES:
+                    print(f"Rate limited on {self.name}, retrying: {e}")
+                    continue
+                raise
+            except BaseException:
+                # Cancelled (e.g. a hedge that lost); the slot must still come back
+                self.release(tokens, failed=True)
+                raise
+            if isinstance(result, TextStream):
+                result.add_close_callback(
+                    lambda usage: self.release(tokens, (usage or {}).get('total_tokens'))
+                )
+            else:
+                self.release(tokens, getattr(getattr(result, 'usage', None), 'total_tokens', None))
+            return result
+
+    async def run_async(self, tokens: int, call, timeout: float = RATE_LIMIT_MAX_WAIT_SECONDS):
+        """Async version of run; call is a coroutine function."""
+        for attempt in range(RATE_LIMIT_MAX_RETRIES + 1):
+            await self.acquire_async(tokens, timeout)
+            try:
+                result = await call()
+            except Exception as e:
+                throttled = getattr(e, 'status_code', None) == 429
+                self.release(tokens, throttled=throttled, failed=not throttled,
+                             retry_after=_retry_after(e) if throttled else None)
+                if throttled and attempt < RATE_LIMIT_MAX_RETRIES:
+                    print(f"Rate limited on {self.name}, retrying: {e}")
+                    continue
+                raise
+            except BaseException:
+                # Cancelled (e.g. a hedge that lost); the slot must still come back
+                self.release(tokens, failed=True)
+                raise
+            self.release(tokens, getattr(getattr(result, 'usage', None), 'total_tokens', None))
+            return result
+
+    def stats(self) -> dict:
+        with self._cond:
+            return dict(self._stats, concurrency=self.concurrency, in_flight=self._in_flight,
+                        paused_for=max(self._paused_until - time.monotonic(), 0.0))
+
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def _deployment_name(endpoint: str) -> str:
+    return endpoint.rstrip('/').rsplit('/', 1)[-1]
+
+
+def get_rate_limiter(endpoint: str, limits: tuple = None) -> DeploymentRateLimiter:
+    """
+    The shared limiter for a deployment endpoint (quotas are per resource and deployment).
+
+    limits is the (requests, tokens) per minute quota to create it with; by
+    default it comes from DEPLOYMENT_RATE_LIMITS by deployment name, and a
+    deployment with no quota there is not bucket-limited at all.
+    """
+    limiter = _rate_limiters.get(endpoint)
+    if limiter is None:
+        with _rate_limiters_lock:
+            limiter = _rate_limiters.get(endpoint)
+            if limiter is None:
+                name = _deployment_name(endpoint)
+                rpm, tpm = limits or DEPLOYMENT_RATE_LIMITS.get(name, (None, None))
+                limiter = DeploymentRateLimiter(name, rpm, tpm)
+                _rate_limiters[endpoint] = limiter
+    return limiter
+
+
+def configure_rate_limit(deployment: str, requests_per_minute: float, tokens_per_minute: float,
+                         max_concurrency: int = None):
+    """
+    Set a deployment's quota (and optionally its concurrency cap), including limiters already in use.
+
+    None for either quota turns that bucket off.
+    """
+    DEPLOYMENT_RATE_LIMITS[deployment] = (requests_per_minute, tokens_per_minute)
+    with _rate_limiters_lock:
+        for limiter in _rate_limiters.values():
+            if limiter.name != deployment:
+                continue
+            with limiter._cond:
+                limiter._refill(time.monotonic())
+                if requests_per_minute and not limiter.requests_per_minute:
+                    limiter._request_budget = float(requests_per_minute)
+                if tokens_per_minute and not limiter.tokens_per_minute:
+                    limiter._token_budget = float(tokens_per_minute)
+                limiter.requests_per_minute = float(requests_per_minute) if requests_per_minute else None
+                limiter.tokens_per_minute = float(tokens_per_minute) if tokens_per_minute else None
+                if max_concurrency is not None:
+                    limiter.max_concurrency = max_concurrency
+                    limiter.concurrency = min(limiter.concurrency, float(max_concurrency))
+                limiter._cond.notify_all()
+
+
+def rate_limit_stats() -> dict:
+    """Per-endpoint limiter counters, for logging and tuning the quotas above."""
+    with _rate_limiters_lock:
+        return {endpoint: limiter.stats() for endpoint, limiter in _rate_limiters.items()}
+
+
+# ── Retries and hedging ────────────────────────────────────────────────────
+# Transient failures (timeouts, dropped connections, 5xx) are retried with
+# full-jitter exponential backoff, and every attempt has a deadline so one
+# stuck call cannot hang a request. 429s are handled by the rate limiter above.
+# A hedged call also sends a duplicate to another deployment of the same model
+# (see MODEL_DEPLOYMENTS) if the first has not answered by the deployment's
+# recent p95 latency, and takes whichever answers first; the slowest few percent
+# of calls then cost about p95 plus one normal call instead of an unbounded wait.
+RETRY_MAX_ATTEMPTS = int(os.getenv('GAI_RETRY_MAX_ATTEMPTS', 3))
+RETRY_BASE_DELAY_SECONDS = 0.5
+RETRY_MAX_DELAY_SECONDS = 8.0
+ATTEMPT_TIMEOUT_SECONDS = float(os.getenv('GAI_ATTEMPT_TIMEOUT_SECONDS', 180))
+# Bounds a whole openai_text call: quota waits, retries and hedges included
+CALL_DEADLINE_SECONDS = float(os.getenv('GAI_CALL_DEADLINE_SECONDS', 300))
+TRANSIENT_STATUS_CODES = {408, 500, 502, 503, 504}
+HEDGE_LATENCY_PERCENTILE = 95
+HEDGE_MIN_DELAY_SECONDS = 2.0
+# Used until a deployment has enough recorded latencies for a percentile
+HEDGE_DEFAULT_DELAY_SECONDS = 30.0
+HEDGE_MIN_SAMPLES = 20
+# Failures older than this no longer count against a deployment when routing
+ROUTING_WINDOW_SECONDS = float(os.getenv('GAI_ROUTING_WINDOW_SECONDS', 300))
+
+_hedge_executor = None
+_hedge_executor_lock = threading.Lock()
+
+
+def _get_hedge_executor() -> ThreadPoolExecutor:
+    global _hedge_executor
+    if _hedge_executor is None:
+        with _hedge_executor_lock:
+            if _hedge_executor is None:
+                _hedge_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="gai-hedge")
+    return _hedge_executor
+
+
+class DeadlineExceeded(TimeoutError):
+    """A call (or a hedged round of attempts) ran out of its overall time budget."""
+
+
+def _is_transient(e: Exception) -> bool:
+    """True for errors worth retrying: timeouts, connection failures and 5xx responses."""
+    from azure.core.exceptions import ServiceRequestError, ServiceResponseError
+    from openai import APIConnectionError
+
+    if isinstance(e, (DeadlineExceeded, NoCapacityError)):
+        # Our own time or quota budget ran out; another attempt would only overrun it
+        return False
+    if isinstance(e, (TimeoutError, ConnectionError, ServiceRequestError, ServiceResponseError,
+                      APIConnectionError)):
+        return True
+    return getattr(e, 'status_code', None) in TRANSIENT_STATUS_CODES
+
+
+def _backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff, so callers that failed together do not retry together."""
+    return random.uniform(0, min(RETRY_MAX_DELAY_SECONDS, RETRY_BASE_DELAY_SECONDS * 2 ** attempt))
+
+
+class DeploymentHealth:
+    """Recent outcomes of calls to one deployment: latencies of successes and failure times."""
+
+    def __init__(self, size: int = 200):
+        self._samples = deque(maxlen=size)
+        self._outcomes = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+            self._outcomes.append((time.monotonic(), True))
+
+    def record_failure(self):
+        with self._lock:
+            self._outcomes.append((time.monotonic(), False))
+
+    def percentile(self, q: float, default: float = None, min_samples: int = HEDGE_MIN_SAMPLES):
+        import numpy as np
+
+        with self._lock:
+            if len(self._samples) < max(min_samples, 1):
+                return default
+            return float(np.percentile(self._samples, q))
+
+    def error_rate(self, window: float = ROUTING_WINDOW_SECONDS) -> float:
+        """Share of the calls in the last window seconds that failed."""
+        cutoff = time.monotonic() - window
+        with self._lock:
+            recent = [ok for at, ok in self._outcomes if at >= cutoff]
+        return recent.count(False) / len(recent) if recent else 0.0
+
+
+_deployment_health = {}
+_deployment_health_lock = threading.Lock()
+
+
+def get_deployment_health(endpoint: str, stream: bool = False) -> DeploymentHealth:
+    """Outcomes of full responses, or of opening a stream, for a deployment endpoint."""
+    key = (endpoint, stream)
+    health = _deployment_health.get(key)
+    if health is None:
+        with _deployment_health_lock:
+            health = _deployment_health.setdefault(key, DeploymentHealth())
+    return health
+
+
+def hedge_delay(endpoint: str, stream: bool = False) -> float:
+    """How long to wait for a call to endpoint before sending a hedge."""
+    p95 = get_deployment_health(endpoint, stream).percentile(HEDGE_LATENCY_PERCENTILE,
+                                                              HEDGE_DEFAULT_DELAY_SECONDS)
+    return max(p95, HEDGE_MIN_DELAY_SECONDS)
+
+
+def _discard(future):
+    """Done-callback for a hedge that lost: close its stream so its slot is released."""
+    if not future.cancelled() and future.exception() is None and isinstance(future.result(), TextStream):
+        future.result().close()
+
+
+def first_success(calls: list, delay: float, timeout: float = ATTEMPT_TIMEOUT_SECONDS):
+    """
+    Start calls[0], then each following call after another delay seconds (or
+    as soon as the previous ones have all failed), and return the first result.
+
+    Raises the last error if every call fails, or DeadlineExceeded after timeout.
+    """
+    executor = _get_hedge_executor()
+    deadline = time.monotonic() + timeout
+    pending, waiting, error = set(), list(calls), None
+    while True:
+        if waiting and (not pending or time.monotonic() >= next_at):
+            pending.add(executor.submit(waiting.pop(0)))
+            next_at = time.monotonic() + delay
+        if not pending:
+            raise error
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            for future in pending:
+                future.add_done_callback(_discard)
+            raise DeadlineExceeded(f"No response within {timeout:g}s")
+        if waiting:
+            remaining = min(remaining, max(next_at - time.monotonic(), 0))
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                for loser in pending:
+                    loser.add_done_callback(_discard)
+                return future.result()
+            error = future.exception()
+
+
+async def first_success_async(calls: list, delay: float, timeout: float = ATTEMPT_TIMEOUT_SECONDS):
+    """Async version of first_success; calls are coroutine functions and losers are cancelled."""
+    deadline = time.monotonic() + timeout
+    pending, waiting, error = set(), list(calls), None
+    try:
+        while True:
+            if waiting and (not pending or time.monotonic() >= next_at):
+                pending.add(asyncio.ensure_future(waiting.pop(0)()))
+                next_at = time.monotonic() + delay
+            if not pending:
+                raise error
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise DeadlineExceeded(f"No response within {timeout:g}s")
+            if waiting:
+                remaining = min(remaining, max(next_at - time.monotonic(), 0))
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def call_with_retries(call, attempts: int = RETRY_MAX_ATTEMPTS, deadline: float = None):
+    """
+    Run call(), retrying transient errors with jittered exponential backoff.
+
+    deadline is a time.monotonic() value; no retry starts after it.
+    """
+    for attempt in range(attempts):
+        try:
+            return call()
+        except Exception as e:
+            delay = _backoff_delay(attempt)
+            if (attempt == attempts - 1 or not _is_transient(e)
+                    or (deadline is not None and time.monotonic() + delay >= deadline)):
+                raise
+            print(f"Transient error (attempt {attempt + 1}/{attempts}), retrying in {delay:.1f}s: {e}")
+            time.sleep(delay)
+
+
+async def call_with_retries_async(call, attempts: int = RETRY_MAX_ATTEMPTS, deadline: float = None):
+    """Async version of call_with_retries; call is a coroutine function."""
+    for attempt in range(attempts):
+        try:
+            return await call()
+        except Exception as e:
+            delay = _backoff_delay(attempt)
+            if (attempt == attempts - 1 or not _is_transient(e)
+                    or (deadline is not None and time.monotonic() + delay >= deadline)):
+                raise
+            print(f"Transient error (attempt {attempt + 1}/{attempts}), retrying in {delay:.1f}s: {e}")
+            await asyncio.sleep(delay)
+
+
+# ── Model registry ─────────────────────────────────────────────────────────
+# Logical model name -> the Azure deployments serving it. Adding capacity is a
+# new entry here (or in the JSON file named by GAI_DEPLOYMENTS_FILE, or a call
+# to register_deployment), not new code. Besides where it lives, an entry
+# records the deployment's request quirks:
+#   fixed_params        request fields the deployment forces (o4-mini only takes temperature 1)
+#   omit_params         request fields the deployment rejects
+#   json_object_format  how it spells plain JSON mode when no schema is given
+#   rate_limit          (requests, tokens) per minute, overriding DEPLOYMENT_RATE_LIMITS
+_KEVIN_DEPLOYMENTS = "https://kevin-m86fxp36-eastus2.cognitiveservices.azure.com/openai/deployments/"
+_VIBESET_DEPLOYMENTS = "https://vibesetbackend9912493372.cognitiveservices.azure.com/openai/deployments/"
+MODEL_DEPLOYMENTS = {
+    'o4-mini': [
+        {'endpoint': _KEVIN_DEPLOYMENTS + 'o4-mini', 'api_version': '2025-01-01-preview',
+         'key_field': 'api_key_o3', 'fixed_params': {'temperature': 1.0}, 'omit_params': ['max_tokens']},
+    ],
+    'gpt-4.1': [
+        {'endpoint': _KEVIN_DEPLOYMENTS + 'gpt-4.1', 'api_version': '2025-02-01-preview',
+         'key_field': 'api_key_o3'},
+    ],
+    'gpt-4.1-mini': [
+        {'endpoint': _KEVIN_DEPLOYMENTS + 'gpt-4.1-mini', 'api_version': '2025-02-01-preview',
+         'key_field': 'api_key_o3'},
+    ],
+    'gpt-4o': [
+        {'endpoint': _VIBESET_DEPLOYMENTS + 'gpt-4o', 'api_version': '2025-02-01-preview',
+         'key_field': 'api_key', 'json_object_format': 'json_object'},
+    ],
+    'gpt-4o-mini': [
+        {'endpoint': _VIBESET_DEPLOYMENTS + 'gpt-4o-mini', 'api_version': '2025-02-01-preview',
+         'key_field': 'api_key', 'json_object_format': 'json_object'},
+    ],
+}
+# Seconds of expected latency a deployment is charged for a 100% recent error rate
+ROUTING_ERROR_PENALTY_SECONDS = 60.0
+
+
+def register_deployment(model: str, endpoint: str, api_version: str = '2025-02-01-preview',
+                        key_field: str = 'api_key', **quirks):
+    """Add a deployment for a model (a new model name starts its own list)."""
+    entry = dict(endpoint=endpoint, api_version=api_version, key_field=key_field, **quirks)
+    deployments = MODEL_DEPLOYMENTS.setdefault(model, [])
+    deployments[:] = [d for d in deployments if d['endpoint'] != endpoint] + [entry]
+    return entry
+
+
+def load_deployments(path: str):
+    """Register the deployments in a JSON file shaped like MODEL_DEPLOYMENTS."""
+    with open(path, encoding='utf-8') as f:
+        for model, entries in json.load(f).items():
+            for entry in entries:
+                register_deployment(model, **entry)
+
+
+if os.getenv('GAI_DEPLOYMENTS_FILE'):
+    load_deployments(os.getenv('GAI_DEPLOYMENTS_FILE'))
+
+
+def _route_score(deployment: dict, stream: bool) -> float:
+    """Expected seconds until a call to deployment answers; lower is better."""
+    endpoint = deployment['endpoint']
+    health = get_deployment_health(endpoint, stream)
+    # Untried deployments score as instant so they get traffic and a latency record
+    latency = health.percentile(50, default=0.0, min_samples=1)
+    limiter = get_rate_limiter(endpoint, deployment.get('rate_limit')).stats()
+    load = limiter['in_flight'] / max(limiter['concurrency'], 1.0)
+    return (latency * (1 + load)
+            + health.error_rate() * ROUTING_ERROR_PENALTY_SECONDS
+            + limiter['paused_for'])
+
+
+def rank_deployments(model: str, stream: bool = False) -> List[dict]:
+    """A model's deployments, healthiest and fastest first (registry order breaks ties)."""
+    deployments = MODEL_DEPLOYMENTS.get(model)
+    if not deployments:
+        raise ValueError(f"Invalid model {model!r}. Supported models: {', '.join(sorted(MODEL_DEPLOYMENTS))}.")
+    return sorted(deployments, key=lambda d: _route_score(d, stream))
+
+
+def deployment_stats() -> dict:
+    """Per-deployment health as the router sees it, for logging and tuning."""
+    stats = {}
+    for model, deployments in MODEL_DEPLOYMENTS.items():
+        for deployment in deployments:
+            health = get_deployment_health(deployment['endpoint'])
+            stats[deployment['endpoint']] = {
+                'model': model,
+                'p50': health.percentile(50, min_samples=1),
+                'p95': health.percentile(95, min_samples=1),
+                'error_rate': health.error_rate(),
+                'score': _route_score(deployment, False),
+            }
+    return stats
+
 
 class gai_client:
     """OpenAI Connector."""
@@ -22,141 +1264,210 @@ class gai_client:
                     max_tokens: int = 4095,
                     sysmsg: str = None,
                     to_json: bool = False,
-                    json_schema: dict = None) -> str:
-        
+                    json_schema: dict = None,
+                    stream: bool = False,
+                    use_cache: bool = False,
+                    hedge: bool = False,
+                    timeout: float = ATTEMPT_TIMEOUT_SECONDS,
+                    deadline: float = CALL_DEADLINE_SECONDS) -> Union[str, TextStream]:
+        """
+        With stream=True, returns a TextStream that yields text deltas as they
+        arrive; its .usage is filled in once iteration finishes.
 
-        # 1. Validate model
-        allowed_models = ["gpt-4o", "gpt-4o-mini", "o4-mini", "gpt-4.1", "gpt-4.1-mini"]
-        if model not in allowed_models:
-            raise ValueError(
-                "Invalid model. Only 'gpt-4o', 'gpt-4o-mini', 'o3-mini', and 'gpt-4.1' are supported."
-            )
-        
+        With use_cache=True, identical requests are answered from response_cache.
+        JSON responses are only cached once they parse.
 
+        Calls go through the deployment's DeploymentRateLimiter, which may make
+        them wait for quota and retries 429s. A returned TextStream holds its
+        slot until it is iterated to the end or closed.
 
-        # 2. Build the message list
-        messages = []
-        if sysmsg:
-            messages.append({"role": "system", "content": sysmsg})
-        messages.append({"role": "user", "content": prompt})
+        Each attempt goes to the model's healthiest deployment in
+        MODEL_DEPLOYMENTS (see rank_deployments), so a retry fails over to
+        another deployment when there is one. Transient errors are retried with
+        backoff. No attempt may go longer than timeout seconds without data,
+        and the whole call, quota waits, retries and hedges included, gives up
+        with DeadlineExceeded after deadline seconds. A hedged round that times
+        out, or a quota wait that does, is not retried.
+        With hedge=True a duplicate request goes to the next best deployment
+        once the first has taken longer than the deployment's p95 latency (no
+        duplicate is sent if the model has only one deployment); for a stream
+        this races the opening of the response.
+        """
+        call_deadline = time.monotonic() + deadline
 
-        # 3. Determine response format
-        response_format = None
-        if to_json:
-            response_format = json_schema if json_schema else {"type": "json_object"}
-
-        # 4. o3-mini: Legacy AzureOpenAI client
-        if model == "o4-mini":
-            # 6.1 Grab the same o3 key
-            secret = get_secret('vibeset/azure_ai_foundry')
-            api_key = secret.get('api_key_o3')
-
-            # 6.2 Point to your o4-mini deployment
-            endpoint = (
-                "https://kevin-m86fxp36-eastus2.cognitiveservices.azure.com/"
-                "openai/deployments/o4-mini"
-            )
+        def _remaining():
+            remaining = call_deadline - time.monotonic()
+            if remaining <= 0:
+                raise DeadlineExceeded(f"No response within the {deadline:g}s deadline")
+            return remaining
 
-            from azure.ai.inference import ChatCompletionsClient
-            from azure.core.credentials import AzureKeyCredential
+        cache_key = None
+        if use_cache:
+            cache_key = response_cache_key(model, sysmsg, json_schema, temperature, prompt)
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                return TextStream.from_text(cached) if stream else cached
 
-            client = ChatCompletionsClient(
-                endpoint=endpoint,
-                credential=AzureKeyCredential(api_key),
-                api_version="2025-01-01-preview"
-            )
-            
-            completion = client.complete(
-                messages=messages,
-                #max_completion_tokens=max_completion_tokens, 
-                temperature=1.0,
-                top_p=1.0,
-                model="o4-mini",
-                response_format=response_format
-            )
-            return completion.choices[0].message.content
+        def _store(text):
+            if cache_key is None or not text:
+                return
+            if to_json:
+                try:
+                    json.loads(text)
+                except ValueError:
+                    return
+            response_cache.put(cache_key, text)
 
-        # 5. gpt-4.1: Inference SDK on same server as o3-mini
-        elif model == "gpt-4.1":
-            secret = get_secret('vibeset/azure_ai_foundry')
-            api_key = secret.get('api_key_o3')
-            endpoint = (
-                "https://kevin-m86fxp36-eastus2.cognitiveservices.azure.com/"
-                "openai/deployments/gpt-4.1"
-            )
-            from azure.ai.inference import ChatCompletionsClient
-            from azure.core.credentials import AzureKeyCredential
-
-            # Use the latest GA api_version for Azure OpenAI inference ("2024-06-01").
-            client = ChatCompletionsClient(
-                endpoint=endpoint,
-                credential=AzureKeyCredential(api_key),
-                api_version="2025-02-01-preview"
-            )
-            completion = client.complete(
-                messages=messages,
-                max_tokens=max_tokens,
-                temperature=temperature,
-                top_p=1.0,
-                model=model,
-                response_format=response_format
-            )
-            return completion.choices[0].message.content
-        elif model == "gpt-4.1-mini":
-            secret = get_secret('vibeset/azure_ai_foundry')
-            api_key = secret.get('api_key_o3')
-            endpoint = (
-                "https://kevin-m86fxp36-eastus2.cognitiveservices.azure.com/"
-                "openai/deployments/gpt-4.1-mini"
+        def _attempt(deployment):
+            endpoint, api_key, api_version, request = self._chat_request(
+                prompt, deployment, temperature, max_tokens, sysmsg, to_json, json_schema
             )
+            client = get_client('chat', endpoint, api_key, api_version=api_version)
+            limiter = get_rate_limiter(endpoint, deployment.get('rate_limit'))
+            tokens = estimate_request_tokens(request, max_tokens)
+            health = get_deployment_health(endpoint, stream)
+            started = time.perf_counter()
+            try:
+                if stream:
+                    def _open():
+                        chunks = client.complete(
+                            stream=True,
+                            model_extras={"stream_options": {"include_usage": True}},
+                            read_timeout=min(timeout, _remaining()),
+                            **request
+                        )
+                        return TextStream(chunks, started, on_complete=_store)
+                    result = limiter.run(tokens, _open, timeout=min(RATE_LIMIT_MAX_WAIT_SECONDS, _remaining()))
+                else:
+                    completion = limiter.run(
+                        tokens, lambda: client.complete(read_timeout=min(timeout, _remaining()), **request),
+                        timeout=min(RATE_LIMIT_MAX_WAIT_SECONDS, _remaining())
+                    )
+                    result = completion.choices[0].message.content
+            except Exception as e:
+                if _is_transient(e) or getattr(e, 'status_code', None) == 429:
+                    health.record_failure()
+                raise
+            health.record(time.perf_counter() - started)
+            return result
 
-            from azure.ai.inference import ChatCompletionsClient
-            from azure.core.credentials import AzureKeyCredential
+        def _route():
+            # Ranked again on every retry, so a failing deployment loses its place
+            deployments = rank_deployments(model, stream)
+            if not hedge or len(deployments) < 2:
+                return _attempt(deployments[0])
+            calls = [lambda d=d: _attempt(d) for d in deployments]
+            return first_success(calls, hedge_delay(deployments[0]['endpoint'], stream), min(timeout, _remaining()))
 
-            client = ChatCompletionsClient(
-                endpoint=endpoint,
-                credential=AzureKeyCredential(api_key),
-                api_version="2025-02-01-preview"
-            )
+        def _call():
+            result = call_with_retries(_route, deadline=call_deadline)
+            if not stream:
+                _store(result)
+            return result
 
-            completion = client.complete(
-                messages=messages,
-                max_tokens=max_tokens,
-                temperature=temperature,
-                top_p=1.0,
-                model=model,
-                response_format=response_format
-            )
-            return completion.choices[0].message.content
-        # 6. gpt-4o / gpt-4o-mini: Existing ChatCompletionsClient branch
-        else:
-            secret = get_secret('vibeset/azure_ai_foundry')
-            key = secret.get('api_key')
-            endpoint = (
-                f"https://vibesetbackend9912493372.cognitiveservices.azure.com"
-                f"/openai/deployments/{model}"
-            )
-            from azure.ai.inference import ChatCompletionsClient
-            from azure.core.credentials import AzureKeyCredential
+        return _with_secret_retry(AZURE_SECRET_NAME, _call)
 
-            client = ChatCompletionsClient(
-                endpoint=endpoint,
-                credential=AzureKeyCredential(key),
-                api_version='2025-02-01-preview'
-            )
-            if to_json and not json_schema:
-                response_format = "json_object"
-
-            completion = client.complete(
-                messages=messages,
-                max_tokens=max_tokens,
-                temperature=temperature,
-                top_p=1.0,
-                model=model,
-                response_format=response_format
+    async def openai_text_async(self,
+                                prompt: str,
+                                model: str = DEFAULT_OAI_MODEL,
+                                temperature: float = 0.1,
+                                max_tokens: int = 4095,
+                                sysmsg: str = None,
+                                to_json: bool = False,
+                                json_schema: dict = None,
+                                hedge: bool = False,
+                                timeout: float = ATTEMPT_TIMEOUT_SECONDS,
+                                deadline: float = CALL_DEADLINE_SECONDS) -> str:
+        """Async counterpart of openai_text; returns the same completion text."""
+        call_deadline = time.monotonic() + deadline
+
+        def _remaining():
+            remaining = call_deadline - time.monotonic()
+            if remaining <= 0:
+                raise DeadlineExceeded(f"No response within the {deadline:g}s deadline")
+            return remaining
+
+        async def _attempt(deployment):
+            endpoint, api_key, api_version, request = await asyncio.to_thread(
+                self._chat_request,
+                prompt, deployment, temperature, max_tokens, sysmsg, to_json, json_schema
             )
+            client = get_async_client('chat', endpoint, api_key, api_version=api_version)
+            limiter = get_rate_limiter(endpoint, deployment.get('rate_limit'))
+            health = get_deployment_health(endpoint)
+            started = time.perf_counter()
+
+            async def _complete():
+                # The attempt timeout covers the call itself, not the wait for quota,
+                # but never outlasts the call's deadline; it is worked out before the
+                # request coroutine exists so a spent deadline leaves nothing unawaited
+                attempt_timeout = min(timeout, _remaining())
+                return await asyncio.wait_for(client.complete(read_timeout=attempt_timeout, **request),
+                                              attempt_timeout)
+
+            try:
+                completion = await limiter.run_async(
+                    estimate_request_tokens(request, max_tokens),
+                    _complete,
+                    timeout=min(RATE_LIMIT_MAX_WAIT_SECONDS, _remaining())
+                )
+            except Exception as e:
+                if _is_transient(e) or getattr(e, 'status_code', None) == 429:
+                    health.record_failure()
+                raise
+            health.record(time.perf_counter() - started)
             return completion.choices[0].message.content
-        
+
+        async def _route():
+            deployments = rank_deployments(model)
+            if not hedge or len(deployments) < 2:
+                return await _attempt(deployments[0])
+            calls = [lambda d=d: _attempt(d) for d in deployments]
+            return await first_success_async(calls, hedge_delay(deployments[0]['endpoint']),
+                                             min(timeout, _remaining()))
+
+        async def _call():
+            return await call_with_retries_async(_route, deadline=call_deadline)
+
+        return await _with_secret_retry_async(AZURE_SECRET_NAME, _call)
+
+    def _chat_request(self,
+                      prompt: str,
+                      deployment: dict,
+                      temperature: float,
+                      max_tokens: int,
+                      sysmsg: str,
+                      to_json: bool,
+                      json_schema: dict):
+        """Build (endpoint, api_key, api_version, complete() kwargs) for one MODEL_DEPLOYMENTS entry."""
+
+        # 1. Build the message list
+        messages = []
+        if sysmsg:
+            messages.append({"role": "system", "content": sysmsg})
+        messages.append({"role": "user", "content": prompt})
+
+        # 2. Determine response format
+        response_format = None
+        if to_json:
+            response_format = json_schema or deployment.get('json_object_format', {"type": "json_object"})
+
+        # 3. Apply the deployment's quirks
+        request = dict(
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            top_p=1.0,
+            model=_deployment_name(deployment['endpoint']),
+            response_format=response_format
+        )
+        for name in deployment.get('omit_params', ()):
+            request.pop(name, None)
+        request.update(deployment.get('fixed_params', {}))
+
+        api_key = get_secret(AZURE_SECRET_NAME).get(deployment['key_field'])
+        return deployment['endpoint'], api_key, deployment['api_version'], request
+
     def text(self,
             prompt: str,
             model: str = "mercury-coder-small",
@@ -164,7 +1475,8 @@ class gai_client:
             max_tokens: int = 30000,
             sysmsg: str = None,
             to_json: bool = False,
-            json_schema: dict = None) -> str:
+            json_schema: dict = None,
+            stream: bool = False) -> Union[str, TextStream]:
         """
         Generate text using Mercury LLM.
         
@@ -176,25 +1488,64 @@ class gai_client:
             sysmsg: Optional system message to guide the model's behavior
             to_json: Boolean flag to indicate if the response should be in JSON format
             json_schema: Optional schema for structured JSON outputs
+            stream: Return a TextStream of text deltas instead of the full text
             
         Returns:
-            The generated text from the model
+            The generated text from the model (or a TextStream if stream=True)
         """
-        from openai import OpenAI
+        request = self._mercury_request(prompt, model, temperature, max_tokens,
+                                        sysmsg, to_json, json_schema)
+
+        def _create():
+            client = get_client('openai', MERCURY_BASE_URL, _mercury_api_key())
+            if stream:
+                started = time.perf_counter()
+                chunks = client.chat.completions.create(
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    **request
+                )
+                return TextStream(chunks, started)
+            return client.chat.completions.create(**request)
         
-        # Get API key from secrets (you'll need to add this to your secrets)
-        try:
-            api_key = get_secret('vibeset/mercury')['api_key']
-        except:
-            # Fallback in case the specific Mercury secret isn't set up yet
-            api_key = "[YOUR_API_KEY]"
+        response = _with_secret_retry(MERCURY_SECRET_NAME, lambda: call_with_retries(_create))
+        if stream:
+            return response
         
-        # Initialize the client with the InceptionLabs base URL
-        client = OpenAI(
-            api_key=api_key,
-            base_url="https://api.inceptionlabs.ai/v1"
+        # Return the generated text
+        return response.choices[0].message.content
+
+    async def text_async(self,
+                         prompt: str,
+                         model: str = "mercury-coder-small",
+                         temperature: float = 0.1,
+                         max_tokens: int = 30000,
+                         sysmsg: str = None,
+                         to_json: bool = False,
+                         json_schema: dict = None) -> str:
+        """Async counterpart of text; returns the same generated text."""
+        request = self._mercury_request(prompt, model, temperature, max_tokens,
+                                        sysmsg, to_json, json_schema)
+
+        async def _create():
+            api_key = await asyncio.to_thread(_mercury_api_key)
+            client = get_async_client('openai', MERCURY_BASE_URL, api_key)
+            return await client.chat.completions.create(**request)
+
+        response = await _with_secret_retry_async(
+            MERCURY_SECRET_NAME, lambda: call_with_retries_async(_create)
         )
-        
+        return response.choices[0].message.content
+
+    def _mercury_request(self,
+                         prompt: str,
+                         model: str,
+                         temperature: float,
+                         max_tokens: int,
+                         sysmsg: str,
+                         to_json: bool,
+                         json_schema: dict) -> dict:
+        """Build the chat.completions.create() kwargs for a Mercury call."""
         # Build the message list
         messages = []
         if sysmsg:
@@ -213,63 +1564,181 @@ class gai_client:
                     "type": "json_schema",
                     "schema": json_schema
                 }
-        
-        # Make the API call
-        response = client.chat.completions.create(
+
+        return dict(
             model=model,
             messages=messages,
             temperature=temperature,
             max_tokens=max_tokens,
-            response_format=response_format
+            response_format=response_format,
+            timeout=ATTEMPT_TIMEOUT_SECONDS
         )
-        
-        # Return the generated text
-        return response.choices[0].message.content
+
+    async def gather_texts(self,
+                           prompts: List[str],
+                           max_in_flight: int = 8,
+                           use_mercury: bool = False,
+                           return_exceptions: bool = False,
+                           **kwargs) -> List[str]:
+        """
+        Run many prompts concurrently on one event loop, at most max_in_flight at a time.
+
+        Each prompt goes through openai_text_async (or text_async when use_mercury
+        is set) with the remaining keyword arguments. Results come back in prompt
+        order; with return_exceptions=True a failed prompt yields its exception
+        instead of cancelling the batch.
+        """
+        call = self.text_async if use_mercury else self.openai_text_async
+        semaphore = asyncio.Semaphore(max_in_flight)
+
+        async def _bounded(prompt):
+            async with semaphore:
+                return await call(prompt, **kwargs)
+
+        return await asyncio.gather(*(_bounded(p) for p in prompts),
+                                    return_exceptions=return_exceptions)
         
     @staticmethod
     def get_embedding(
         text: Union[str, List[str]],
         model: str = "text-embedding-3-small",
-    ) -> np.ndarray:
+        use_store: bool = True,
+    ) -> "np.ndarray":
         """
         Generate embeddings for a single string or a list of strings.
+
+        Duplicate strings are embedded once, previously seen strings come from
+        embedding_store (unless use_store=False), and the rest are sent in
+        provider-sized batches on a small thread pool.
         Returns:
             • np.ndarray shape (dim,)  if input was str
             • np.ndarray shape (N, dim) if input was list[str]
         """
+        import numpy as np
+
         # ── 1. Normalize input ─────────────────────────────────────────────
         is_single = isinstance(text, str)
-        inputs = [text] if is_single else text
+        inputs = [text] if is_single else list(text)
+        if not inputs:
+            return np.empty((0,), dtype=np.float32)
 
-        # ── 2. Shared key from secret manager ──────────────────────────────
-        key = get_secret("vibeset/azure_ai_foundry")["api_key_o3"]
+        def _embed(batch):
+            def _call():
+                kind, endpoint, key, api_version = _embedding_route(model)
+                client = get_client(kind, endpoint, key, api_version=api_version)
+                if kind == 'embeddings':
+                    resp = client.embed(input=batch, model=model)
+                else:
+                    resp = client.embeddings.create(input=batch, model=model)
+                return [item.embedding for item in resp.data]
+            arr = np.asarray(_with_secret_retry(AZURE_SECRET_NAME, _call), dtype=np.float32)
+            # Stored as soon as it arrives, so a later failing batch does not lose it
+            if use_store:
+                embedding_store.put_many(model, batch, arr)
+            return arr
 
         try:
-            # ── 3. Cohere path ─────────────────────────────────────────────
-            if model == "Cohere-embed-v3-multilingual":
-                client = EmbeddingsClient(
-                    endpoint="https://kevin-m86fxp36-eastus2.services.ai.azure.com/models",
-                    credential=AzureKeyCredential(key)
-                )
-                resp = client.embed(input=inputs, model=model)
-                embeddings = [item.embedding for item in resp.data]
-
-            # ── 4. Azure‑OpenAI path ───────────────────────────────────────
+            vectors, batches = _plan_embedding(inputs, model, use_store)
+            if len(batches) == 1:
+                results = [_embed(batches[0])]
+            elif batches:
+                with ThreadPoolExecutor(max_workers=min(len(batches), EMBEDDING_MAX_WORKERS)) as pool:
+                    results = list(pool.map(_embed, batches))
             else:
-                oa_client = AzureOpenAI(
-                    api_version="2025-02-01-preview",
-                    azure_endpoint="https://vibesetbackend9912493372.cognitiveservices.azure.com/",
-                    api_key=key,
-                )
-                resp = oa_client.embeddings.create(input=inputs, model=model)
-                embeddings = [item.embedding for item in resp.data]
+                results = []
+            return _collect_embeddings(inputs, vectors, batches, results, is_single)
+
+        except Exception as e:
+            print(f"❌  Embedding error: {e}")
+            return np.empty((0,), dtype=np.float32)
 
+    @staticmethod
+    async def get_embedding_async(
+        text: Union[str, List[str]],
+        model: str = "text-embedding-3-small",
+        use_store: bool = True,
+    ) -> "np.ndarray":
+        """Async counterpart of get_embedding; same shapes and the same empty array on error."""
+        import numpy as np
+
+        is_single = isinstance(text, str)
+        inputs = [text] if is_single else list(text)
+        if not inputs:
+            return np.empty((0,), dtype=np.float32)
+        semaphore = asyncio.Semaphore(EMBEDDING_MAX_WORKERS)
+
+        async def _embed(batch):
+            async def _call():
+                kind, endpoint, key, api_version = await asyncio.to_thread(_embedding_route, model)
+                client = get_async_client(kind, endpoint, key, api_version=api_version)
+                if kind == 'embeddings':
+                    resp = await client.embed(input=batch, model=model)
+                else:
+                    resp = await client.embeddings.create(input=batch, model=model)
+                return [item.embedding for item in resp.data]
+            async with semaphore:
+                embeddings = await _with_secret_retry_async(AZURE_SECRET_NAME, _call)
             arr = np.asarray(embeddings, dtype=np.float32)
-            return arr[0] if is_single else arr
+            if use_store:
+                await asyncio.to_thread(embedding_store.put_many, model, batch, arr)
+            return arr
+
+        try:
+            vectors, batches = await asyncio.to_thread(_plan_embedding, inputs, model, use_store)
+            # Let every batch finish (and be stored) before reporting a failed one
+            results = await asyncio.gather(*(_embed(b) for b in batches), return_exceptions=True)
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
+            return await asyncio.to_thread(_collect_embeddings, inputs, vectors, batches, results, is_single)
 
         except Exception as e:
             print(f"❌  Embedding error: {e}")
             return np.empty((0,), dtype=np.float32)
+
+
+def _plan_embedding(inputs: List[str], model: str, use_store: bool):
+    """Split inputs into stored vectors and provider batches of the unique missing texts."""
+    unique = list(dict.fromkeys(inputs))
+    vectors = embedding_store.get_many(model, unique) if use_store else {}
+    missing = [t for t in unique if t not in vectors]
+    batch_size = EMBEDDING_BATCH_SIZES.get(model, DEFAULT_EMBEDDING_BATCH_SIZE)
+    return vectors, _batches(missing, batch_size)
+
+
+def _collect_embeddings(inputs, vectors, batches, results, is_single):
+    """Assemble stored and freshly embedded vectors in input order."""
+    import numpy as np
+
+    for batch, arr in zip(batches, results):
+        vectors.update(zip(batch, arr))
+    arr = np.stack([vectors[t] for t in inputs]).astype(np.float32, copy=False)
+    return arr[0] if is_single else arr
+
+
+def _mercury_api_key() -> str:
+    # Get API key from secrets (you'll need to add this to your secrets)
+    try:
+        return get_secret(MERCURY_SECRET_NAME)['api_key']
+    except:
+        # Fallback in case the specific Mercury secret isn't set up yet
+        return "[YOUR_API_KEY]"
+
+
+def _embedding_route(model: str):
+    """Resolve an embedding model to (client kind, endpoint, api_key, api_version)."""
+    # ── 2. Shared key from secret manager ──────────────────────────────
+    key = get_secret(AZURE_SECRET_NAME)["api_key_o3"]
+
+    # ── 3. Cohere path ─────────────────────────────────────────────────
+    if model == "Cohere-embed-v3-multilingual":
+        return 'embeddings', "https://kevin-m86fxp36-eastus2.services.ai.azure.com/models", key, None
+
+    # ── 4. Azure‑OpenAI path ───────────────────────────────────────────
+    return ('azure_openai',
+            "https://vibesetbackend9912493372.cognitiveservices.azure.com/",
+            key,
+            "2025-02-01-preview")
   
 
 if __name__ == "__main__":
@@ -0,0 +1,105 @@
+"""
+Import-time budget for the app's modules.
+
+Imports each module in a fresh interpreter with -X importtime and fails (exit
+status 1) when one takes longer than its budget, or when it loads a package
+that is meant to be imported on first use only (provider SDKs, boto3, pandas,
+numpy). Every Streamlit worker pays these imports on a cold start, so run this
+before deploying:
+
+    python import_benchmark.py
+    python import_benchmark.py --repeats 7 --scale 2   # on a slow machine
+"""
+from typing import Dict, List, Tuple
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Cumulative import time budget per module, in milliseconds
+IMPORT_BUDGETS_MS = {
+    "job_utils": 50,
+    "aws_utils": 50,
+    "gai_utils": 150,
+    # Dominated by pydantic, which the profile models need at class definition
+    "veer_client_utils": 300,
+}
+
+# Packages none of the modules above may load at import time
+DEFERRED_MODULES = [
+    "azure", "openai", "google.generativeai", "boto3", "botocore", "pandas", "numpy", "dotenv", "tiktoken",
+]
+
+_PROBE = (
+    "import {module}; import json, sys; "
+    "print(json.dumps([m for m in {deferred!r} if m in sys.modules]))"
+)
+
+
+def measure_import(module: str) -> Tuple[float, List[Tuple[float, str]], List[str]]:
+    """
+    Import module in a fresh interpreter.
+
+    Returns:
+        (cumulative_ms, heaviest, deferred_loaded): the module's cumulative
+        import time, its five slowest imports as (self_ms, name), and the
+        DEFERRED_MODULES it loaded
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE.format(module=module, deferred=DEFERRED_MODULES)],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{proc.stderr[-2000:]}")
+
+    cumulative_ms, imports = None, []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        # "import time:   self [us] | cumulative | imported package", nesting shown by indentation
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        imports.append((int(self_us) / 1000, name.strip()))
+        if not name.startswith("  "):
+            # A top-level import closes; keep only the subtree under the benchmarked module
+            if name.strip() == module:
+                cumulative_ms = int(cumulative_us) / 1000
+                break
+            imports = []
+    heaviest = sorted(imports, reverse=True)[:5]
+    return cumulative_ms, heaviest, json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def run_benchmark(budgets: Dict[str, float], repeats: int = 5, scale: float = 1.0) -> bool:
+    """Measure every module (median of repeats) against its budget; True when all pass."""
+    ok = True
+    for module, budget in budgets.items():
+        runs = [measure_import(module) for _ in range(repeats)]
+        median_ms = statistics.median(r[0] for r in runs)
+        _, heaviest, deferred = runs[-1]
+        limit = budget * scale
+        passed = median_ms <= limit and not deferred
+        ok = ok and passed
+        print(f"{'ok  ' if passed else 'FAIL'} {module:<20} {median_ms:7.1f} ms (budget {limit:.0f} ms)")
+        if deferred:
+            print(f"     loads deferred packages at import: {', '.join(deferred)}")
+        if not passed:
+            for self_ms, name in heaviest:
+                print(f"     {self_ms:7.1f} ms  {name}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail when importing the app modules gets slower than budgeted.")
+    parser.add_argument("modules", nargs="*", help="Modules to check (default: all in IMPORT_BUDGETS_MS)")
+    parser.add_argument("--repeats", type=int, default=5, help="Fresh interpreters per module; the median counts")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply every budget (for slower machines)")
+    args = parser.parse_args()
+
+    budgets = {m: IMPORT_BUDGETS_MS.get(m, min(IMPORT_BUDGETS_MS.values())) for m in args.modules} or IMPORT_BUDGETS_MS
+    sys.exit(0 if run_benchmark(budgets, repeats=args.repeats, scale=args.scale) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+import os
+import threading
+import time
+
+# Shared by all sessions in the process; jobs are mostly network-bound
+JOB_MAX_WORKERS = int(os.getenv('JOB_MAX_WORKERS', 8))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=JOB_MAX_WORKERS, thread_name_prefix="veer-job")
+    return _executor
+
+
+class JobCancelled(BaseException):
+    """
+    Raised inside a job's function when it checks in after cancel() was called.
+
+    Like asyncio.CancelledError it is not an Exception, so the broad
+    `except Exception` handlers in the code a job calls do not swallow it.
+    """
+
+
+class Job:
+    """
+    Handle for work running on the background executor.
+
+    The job function receives the Job as its first argument and reports stage
+    events through report(); the UI polls progress, message and details. The
+    handle can live in st.session_state so a Streamlit rerun keeps polling the
+    same job instead of starting the work again.
+    """
+
+    def __init__(self, name: str = ""):
+        self.name = name
+        self.progress = 0.0
+        self.message = "Queued"
+        self.details: Dict = {}
+        self.events = []
+        self.started_at = time.time()
+        self._cancelled = threading.Event()
+        self._future = None
+
+    def report(self, progress: float = None, message: str = None, **details):
+        """Record a stage event. Raises JobCancelled if the job was cancelled."""
+        if self._cancelled.is_set():
+            raise JobCancelled(f"{self.name or 'Job'} was cancelled")
+        if progress is not None:
+            self.progress = max(self.progress, min(float(progress), 1.0))
+        if message is not None:
+            self.message = message
+            self.events.append((time.time() - self.started_at, message))
+        self.details.update(details)
+
+    def cancel(self):
+        """Ask the job to stop; it ends at its next report() (or never starts if still queued)."""
+        self._cancelled.set()
+        if self._future is not None:
+            self._future.cancel()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def done(self) -> bool:
+        return self._future is not None and self._future.done()
+
+    def result(self, timeout: float = None):
+        """The job function's return value; re-raises its exception."""
+        return self._future.result(timeout)
+
+    def exception(self) -> Optional[BaseException]:
+        if not self.done() or self._future.cancelled():
+            return None
+        return self._future.exception()
+
+
+def submit_job(fn: Callable, *args, name: str = "", **kwargs) -> Job:
+    """Start fn(job, *args, **kwargs) on the background executor and return its Job."""
+    job = Job(name)
+
+    def _run():
+        job.report(message="Started")
+        result = fn(job, *args, **kwargs)
+        job.report(progress=1.0, message="Done")
+        return result
+
+    job._future = _get_executor().submit(_run)
+    return job
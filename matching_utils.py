@@ -0,0 +1,230 @@
+from typing import Dict, List, Optional, Tuple
+import threading
+import numpy as np
+from gai_utils import gai_client
+
+DEFAULT_EMBEDDING_MODEL = "text-embedding-3-small"
+
+
+def _as_dict(profile) -> Dict:
+    """Accept either an analyze_profile() dict or a UserProfile model."""
+    if hasattr(profile, "model_dump"):
+        return profile.model_dump()
+    return profile or {}
+
+
+def profile_outward_text(profile) -> str:
+    """Text describing what a user offers and is looking for: goals, skills and connection needs."""
+    outward = _as_dict(profile).get("outward_profile", {})
+    parts = []
+    for goal in outward.get("goals", []):
+        parts.extend(str(v) for v in goal.values() if v)
+    parts.extend(outward.get("skills", []))
+    parts.extend(outward.get("connection_needs", []))
+    return ". ".join(p for p in parts if p)
+
+
+def profile_recommendation_text(profile, kind: str = "all") -> str:
+    """Text of the inward matching recommendations ('mentor', 'peer' or 'all')."""
+    recs = _as_dict(profile).get("inward_profile", {}).get("matching_recommendations", {})
+    parts = []
+    if kind in ("mentor", "all"):
+        parts.extend(recs.get("mentor_types", []))
+    if kind in ("peer", "all"):
+        parts.extend(recs.get("peer_types", []))
+    return ". ".join(p for p in parts if p)
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first, without a full sort."""
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty((0,), dtype=np.int64)
+    idx = np.argpartition(-scores, k - 1)[:k]
+    return idx[np.argsort(-scores[idx])]
+
+
+class ProfileIndex:
+    """
+    In-memory matching index over generated profiles.
+
+    Each profile is stored as two unit vectors: its outward text (goals, skills,
+    connection needs) and its inward matching recommendations. A mentor query
+    scores everyone's outward vector against the querying user's mentor
+    recommendations; a peer query averages the querying user's peer
+    recommendations against others' outward vectors with the reverse direction
+    (their recommendations against the querying user's outward vector). Scores
+    for all candidates are one matrix-vector product.
+
+    Call build_ivf() to switch to approximate search: vectors are clustered with
+    spherical k-means and a query only scores the members of the nprobe closest
+    clusters, so latency stays roughly flat as the index grows.
+    """
+
+    def __init__(self, model: str = DEFAULT_EMBEDDING_MODEL):
+        self.model = model
+        self.ids: List[str] = []
+        self._id_pos: Dict[str, int] = {}
+        self._outward = np.empty((0, 0), dtype=np.float32)
+        self._inward = np.empty((0, 0), dtype=np.float32)
+        self._size = 0
+        self._lock = threading.Lock()
+        # IVF state (None until build_ivf() is called)
+        self._centroids: Optional[np.ndarray] = None
+        self._assignments: Optional[np.ndarray] = None
+        self.nprobe = 8
+
+    def __len__(self):
+        return self._size
+
+    # ── Building ───────────────────────────────────────────────────────────
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        # Empty strings are not valid embedding inputs; use a zero vector for them
+        non_empty = [t for t in texts if t]
+        vectors = gai_client.get_embedding(non_empty, model=self.model) if non_empty else None
+        if non_empty and (vectors.ndim != 2 or vectors.shape[0] != len(non_empty)):
+            raise RuntimeError("Embedding request failed; see the log above.")
+        dim = vectors.shape[1] if non_empty else max(self._outward.shape[1], 1)
+        out = np.zeros((len(texts), dim), dtype=np.float32)
+        if non_empty:
+            out[[i for i, t in enumerate(texts) if t]] = vectors
+        return _normalize(out)
+
+    def _reserve(self, extra: int, dim: int):
+        """Grow the backing matrices geometrically so appends stay amortized O(1)."""
+        needed = self._size + extra
+        if self._outward.shape[1] != dim and self._size == 0:
+            self._outward = np.empty((0, dim), dtype=np.float32)
+            self._inward = np.empty((0, dim), dtype=np.float32)
+        if needed <= self._outward.shape[0]:
+            return
+        capacity = max(needed, 2 * self._outward.shape[0], 64)
+        for name in ("_outward", "_inward"):
+            grown = np.zeros((capacity, dim), dtype=np.float32)
+            grown[:self._size] = getattr(self, name)[:self._size]
+            setattr(self, name, grown)
+
+    def add_profiles(self, profiles: Dict[str, Dict]):
+        """
+        Embed and index profiles.
+
+        Args:
+            profiles: Mapping of profile id -> profile (analyze_profile output or UserProfile).
+                Re-adding an existing id replaces its vectors.
+        """
+        ids = list(profiles)
+        if not ids:
+            return
+        outward = self._embed([profile_outward_text(profiles[i]) for i in ids])
+        inward = self._embed([profile_recommendation_text(profiles[i]) for i in ids])
+
+        with self._lock:
+            new_ids = [i for i in ids if i not in self._id_pos]
+            self._reserve(len(new_ids), outward.shape[1])
+            for i in new_ids:
+                self._id_pos[i] = self._size
+                self.ids.append(i)
+                self._size += 1
+            rows = np.array([self._id_pos[i] for i in ids])
+            self._outward[rows] = outward
+            self._inward[rows] = inward
+            if self._centroids is not None:
+                assignments = np.full(self._size, -1, dtype=np.int64)
+                assignments[:self._assignments.shape[0]] = self._assignments
+                assignments[rows] = np.argmax(outward @ self._centroids.T, axis=1)
+                self._assignments = assignments
+
+    def add_profile(self, profile_id: str, profile: Dict):
+        self.add_profiles({profile_id: profile})
+
+    def build_ivf(self, nlist: int = None, nprobe: int = 8, iterations: int = 10, seed: int = 0):
+        """
+        Cluster the outward vectors for approximate search.
+
+        Args:
+            nlist: Number of clusters (default: about sqrt of the index size)
+            nprobe: Clusters scanned per query; higher is more accurate and slower
+            iterations: Spherical k-means iterations
+        """
+        with self._lock:
+            vectors = self._outward[:self._size]
+            if self._size == 0:
+                return
+            nlist = min(nlist or max(int(np.sqrt(self._size)), 1), self._size)
+            rng = np.random.default_rng(seed)
+            centroids = vectors[rng.choice(self._size, nlist, replace=False)].copy()
+            for _ in range(iterations):
+                assignments = self._assign(vectors, centroids)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assignments, vectors)
+                empty = ~sums.any(axis=1)
+                # Re-seed empty clusters from random points
+                sums[empty] = vectors[rng.choice(self._size, int(empty.sum()))]
+                centroids = _normalize(sums)
+            self._centroids = centroids
+            self._assignments = self._assign(vectors, centroids)
+            self.nprobe = nprobe
+
+    @staticmethod
+    def _assign(vectors: np.ndarray, centroids: np.ndarray, chunk: int = 16384) -> np.ndarray:
+        # Chunked so the (n, nlist) score matrix stays small for large indexes
+        out = np.empty(vectors.shape[0], dtype=np.int64)
+        for start in range(0, vectors.shape[0], chunk):
+            out[start:start + chunk] = np.argmax(vectors[start:start + chunk] @ centroids.T, axis=1)
+        return out
+
+    # ── Querying ───────────────────────────────────────────────────────────
+    def _candidates(self, query: np.ndarray) -> Optional[np.ndarray]:
+        if self._centroids is None:
+            return None
+        probes = _top_k(self._centroids @ query, self.nprobe)
+        return np.flatnonzero(np.isin(self._assignments, probes))
+
+    def query(self, profile, k: int = 10, kind: str = "mentor",
+              exclude_id: str = None) -> List[Tuple[str, float]]:
+        """
+        Find the best mentor or peer matches for a profile.
+
+        Args:
+            profile: The querying user's profile
+            k: Number of matches to return
+            kind: 'mentor' or 'peer'
+            exclude_id: Id to leave out of the results (usually the querying user)
+
+        Returns:
+            List of (profile_id, score) pairs, best match first
+        """
+        if kind not in ("mentor", "peer"):
+            raise ValueError("kind must be 'mentor' or 'peer'")
+        rec_vec, own_vec = self._embed([profile_recommendation_text(profile, kind),
+                                        profile_outward_text(profile)])
+
+        with self._lock:
+            outward = self._outward[:self._size]
+            inward = self._inward[:self._size]
+            candidates = self._candidates(rec_vec)
+            if candidates is not None:
+                outward, inward = outward[candidates], inward[candidates]
+
+            scores = outward @ rec_vec
+            if kind == "peer":
+                scores = 0.5 * scores + 0.5 * (inward @ own_vec)
+
+            if exclude_id is not None and exclude_id in self._id_pos:
+                pos = self._id_pos[exclude_id]
+                if candidates is None:
+                    scores[pos] = -np.inf
+                else:
+                    scores[candidates == pos] = -np.inf
+
+            best = _top_k(scores, k + (exclude_id is not None))
+            rows = best if candidates is None else candidates[best]
+            return [(self.ids[r], float(scores[b])) for r, b in zip(rows, best)
+                    if np.isfinite(scores[b])][:k]
@@ -1,10 +1,12 @@
 import streamlit as st
 import time
 import json
-import tempfile
+import hashlib
 import os
-from gai_utils import gai_client
-from veer_client_utils import analyze_profile
+from job_utils import JobCancelled, submit_job
+
+# Typical size of a generated profile JSON, used to estimate streaming progress
+EXPECTED_PROFILE_CHARS = 5000
 
 # Initialize session state variables
 if 'step' not in st.session_state:
@@ -21,6 +23,8 @@ if 'recording_feedback' not in st.session_state:
     st.session_state.recording_feedback = ""
 if 'user_name' not in st.session_state:
     st.session_state.user_name = ""
+if 'profile_feedback' not in st.session_state:
+    st.session_state.profile_feedback = ""
 
 # Set up the page configuration
 st.set_page_config(
@@ -88,92 +92,268 @@ st.markdown("""
 st.markdown('<div class="main-header">Veer</div>', unsafe_allow_html=True)
 st.markdown('<div class="sub-header">Goal Manifestation & Matchmaking Platform</div>', unsafe_allow_html=True)
 
+# Transcription tuning: chunks are sent to the recognizer concurrently, each
+# attempt is bounded by a socket timeout, and failed chunks are retried alone.
+TRANSCRIBE_MAX_WORKERS = int(os.getenv('TRANSCRIBE_MAX_WORKERS', 4))
+TRANSCRIBE_CHUNK_TIMEOUT = float(os.getenv('TRANSCRIBE_CHUNK_TIMEOUT', 30))
+TRANSCRIBE_CHUNK_RETRIES = int(os.getenv('TRANSCRIBE_CHUNK_RETRIES', 2))
+
+def is_transient_recognition_error(e):
+    """
+    True for recognizer failures worth retrying: dropped connections, timeouts and 429/5xx responses
+    
+    speech_recognition wraps the urllib error in a RequestError, so the HTTP
+    status is read from the error it was raised from; a bad key, an exhausted
+    quota or any other 4xx fails the same way on every attempt.
+    """
+    from urllib.error import HTTPError, URLError
+    
+    cause = e if isinstance(e, URLError) else (e.__cause__ or e.__context__)
+    if isinstance(cause, HTTPError):
+        return cause.code == 429 or cause.code >= 500
+    return isinstance(cause, (URLError, OSError)) or isinstance(e, OSError)
+
+def recognize_with_retry(recognizer, audio_data, retries=TRANSCRIBE_CHUNK_RETRIES):
+    """
+    Runs recognize_google on one piece of audio, retrying transient failures
+    (see is_transient_recognition_error); other request errors are raised at once
+    
+    Args:
+        recognizer: A speech_recognition Recognizer (its operation_timeout bounds each attempt)
+        audio_data: The AudioData to recognize
+        retries (int): How many times to re-issue a failed or timed-out request
+        
+    Returns:
+        str: The recognized text, or "" if the audio contains no recognizable speech
+    """
+    import speech_recognition as sr
+    
+    for attempt in range(retries + 1):
+        try:
+            return recognizer.recognize_google(audio_data)
+        except sr.UnknownValueError:
+            # Silence or unintelligible audio; retrying will not help
+            return ""
+        except (sr.RequestError, OSError) as e:
+            if attempt == retries or not is_transient_recognition_error(e):
+                raise
+            print(f"Chunk transcription failed ({e}), retrying...")
+            time.sleep(0.5 * 2 ** attempt)
+
 # Function to transcribe audio using SpeechRecognition
-def transcribe_audio(audio_file_path):
+def transcribe_audio(audio, format=None, max_workers=TRANSCRIBE_MAX_WORKERS,
+                     chunk_timeout=TRANSCRIBE_CHUNK_TIMEOUT, retries=TRANSCRIBE_CHUNK_RETRIES,
+                     return_stats=False, on_progress=None):
     """
-    Transcribes audio data using SpeechRecognition library with chunking for longer files
+    Transcribes audio data using SpeechRecognition library, splitting at natural pauses
+    
+    The recording is segmented with voice activity detection: silence at the
+    edges and long pauses are not uploaded, and chunks end at pauses rather
+    than mid-word while staying under the recognizer's length limit.
     
     Args:
-        audio_file_path (str): Path to the audio file
+        audio: Mono 16 kHz int16 samples, audio file bytes, an AudioSegment or a file path
+        format (str): File format hint when audio is bytes (e.g. 'mp3')
+        max_workers (int): Number of chunks transcribed concurrently
+        chunk_timeout (float): Seconds allowed for each recognizer request
+        retries (int): Retries per chunk before giving up on the file
+        return_stats (bool): Also return the segmentation stats (speech_ratio etc.)
+        on_progress (callable): Called as on_progress(chunks_done, chunks_total) as chunks finish
         
     Returns:
         str: The transcribed text or error message
+        (str, dict): The text and segmentation stats, if return_stats is True
     """
     import speech_recognition as sr
-    from pydub import AudioSegment
-    import wave
-    import math
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from audio_utils import load_pcm, segment_speech, TARGET_SAMPLE_RATE
     
     # Initialize recognizer
     recognizer = sr.Recognizer()
+    recognizer.operation_timeout = chunk_timeout
+    
+    # Decode (or reuse) mono 16 kHz PCM entirely in memory
+    samples = load_pcm(audio, format)
+    chunks, stats = segment_speech(samples, TARGET_SAMPLE_RATE)
+    print(f"Speech is {stats['speech_ratio']:.0%} of the recording "
+          f"({stats['speech_seconds']:.1f}s of {stats['total_seconds']:.1f}s) in {stats['chunks']} chunk(s)")
+    
+    def transcribe_chunk(chunk):
+        audio_data = sr.AudioData(chunk.tobytes(), TARGET_SAMPLE_RATE, 2)
+        return recognize_with_retry(recognizer, audio_data, retries)
+    
+    # Transcribe chunks concurrently, then put the results back in chunk order
+    chunk_transcripts = [""] * len(chunks)
+    if on_progress:
+        on_progress(0, len(chunks))
+    if chunks:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks)))) as pool:
+            futures = {pool.submit(transcribe_chunk, chunk): i for i, chunk in enumerate(chunks)}
+            for done, future in enumerate(as_completed(futures), start=1):
+                chunk_transcripts[futures[future]] = future.result()
+                if on_progress:
+                    on_progress(done, len(chunks))
+    
+    transcript = " ".join(t for t in chunk_transcripts if t).strip()
+    if return_stats:
+        return transcript, stats
+    return transcript
+
+def save_recording(audio, format="wav"):
+    """
+    Keeps a recording in session state as playback bytes plus decoded PCM
+    
+    Streamlit reruns the script on every interaction and the recorder widgets keep
+    returning the same audio, so an unchanged recording is recognized by its
+    fingerprint and not decoded again.
     
-    # Check if the file is short enough to process directly
-    with wave.open(audio_file_path, 'rb') as wf:
-        frames = wf.getnframes()
-        rate = wf.getframerate()
-        duration = frames / float(rate)
+    Args:
+        audio: A pydub AudioSegment (audiorecorder) or the bytes of an audio file
+        format (str): File format of the bytes (e.g. 'wav', 'mp3')
         
-    # If the audio is short (less than 55 seconds), process it directly
-    if duration < 55:
-        with sr.AudioFile(audio_file_path) as source:
-            audio_data = recognizer.record(source)
-            return recognizer.recognize_google(audio_data)
+    Returns:
+        dict: The stored recording with "audio" (playback bytes), "format" and "pcm" entries
+    """
+    from audio_utils import load_pcm, to_wav_bytes
+    
+    is_segment = hasattr(audio, "raw_data")
+    fingerprint = hashlib.md5(audio.raw_data if is_segment else audio).hexdigest()
+    recordings = st.session_state.recordings
+    if recordings and recordings[-1]["fingerprint"] == fingerprint:
+        return recordings[-1]
+    
+    recording = {
+        "fingerprint": fingerprint,
+        "audio": to_wav_bytes(audio) if is_segment else bytes(audio),
+        "format": format,
+        "pcm": load_pcm(audio, format),
+    }
+    recordings.append(recording)
+    
+    # Speculatively start transcribing while the user is still on this screen
+    start_transcription_job(recording)
+    return recording
+
+def with_name(transcript, user_name):
+    """Properly prepend the name to the transcript if it's not already there"""
+    if not transcript.lower().startswith(f"my name is {user_name.lower()}"):
+        transcript = f"My name is {user_name}. " + transcript
+    return transcript
+
+def cancel_jobs():
+    """Cancel the transcription job and any analysis started on its transcript"""
+    for key in ("transcription_job", "profile_job"):
+        job = st.session_state.get(key)
+        if job is not None:
+            job.cancel()
+            del st.session_state[key]
+
+def start_transcription_job(recording):
+    """Replace any running transcription with one for this recording"""
+    cancel_jobs()
+    job = submit_job(run_transcription_job, recording["pcm"], name="transcription")
+    st.session_state.transcription_job = job
+
+def start_profile_job(transcript_with_name):
+    """Submit an analysis job, remembering which exact transcript it analyzes"""
+    job = submit_job(run_profile_job, transcript_with_name, name="profile")
+    job.details["transcript"] = transcript_with_name
+    return job
+
+def ensure_profile_job(transcript_with_name, start=True):
+    """
+    Makes sure the analysis in session state is for this exact transcript
     
-    # For longer files, use chunking approach
+    A running or finished speculative job for the same text is kept; one for
+    different text is cancelled and replaced. With start=False it is only
+    cancelled, so edits while typing do not each pay for an analysis.
+    """
+    job = st.session_state.get("profile_job")
+    if job is not None and job.details.get("transcript") != transcript_with_name:
+        job.cancel()
+        job = None
+    if job is None and start:
+        job = start_profile_job(transcript_with_name)
+    if job is None:
+        st.session_state.pop("profile_job", None)
     else:
-        # Load with pydub for more format support
-        audio = AudioSegment.from_file(audio_file_path)
-        audio = audio.set_channels(1)  # Convert to mono
-        audio = audio.set_frame_rate(16000)  # Common rate for speech recognition
-        
-        # Export to a temporary WAV file
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.wav')
-        temp_file_path = temp_file.name
-        temp_file.close()
-        audio.export(temp_file_path, format="wav")
-        
-        # Process the exported file in chunks
-        with wave.open(temp_file_path, 'rb') as wf:
-            frames = wf.getnframes()
-            rate = wf.getframerate()
-            duration = frames / float(rate)
-        
-        # Split into 55-second chunks to stay within Google's limits
-        chunk_duration = 55
-        chunk_size = int(chunk_duration * 16000)  # at 16kHz sample rate
-        chunks = math.ceil(duration / chunk_duration)
-        
-        full_transcript = ""
-        
-        # Process each chunk
-        for i in range(chunks):
-            start_time = i * chunk_duration * 1000  # in milliseconds for pydub
-            end_time = min((i + 1) * chunk_duration * 1000, len(audio))
-            
-            # Extract chunk
-            audio_chunk = audio[start_time:end_time]
-            
-            # Save chunk to temporary file
-            chunk_file = tempfile.NamedTemporaryFile(delete=False, suffix='.wav')
-            chunk_path = chunk_file.name
-            chunk_file.close()
-            audio_chunk.export(chunk_path, format="wav")
-            
-            # Transcribe chunk
-            with sr.AudioFile(chunk_path) as source:
-                audio_data = recognizer.record(source)
-                chunk_transcript = recognizer.recognize_google(audio_data)
-                full_transcript += " " + chunk_transcript
-            
-            # Clean up temporary chunk file
-            if os.path.exists(chunk_path):
-                os.unlink(chunk_path)
-        
-        # Clean up main temporary file
-        if os.path.exists(temp_file_path):
-            os.unlink(temp_file_path)
-        
-        return full_transcript.strip()
+        st.session_state.profile_job = job
+    return job
+
+def run_transcription_job(job, pcm):
+    """Background job for step 3: transcribe the recording, reporting each finished chunk"""
+    job.report(progress=0.05, message="Finding speech in your recording...")
+    
+    def chunk_done(done, total):
+        if total:
+            job.report(progress=0.05 + 0.9 * done / total,
+                       message=f"Transcribed {done} of {total} part(s) of your recording")
+    
+    return transcribe_audio(pcm, on_progress=chunk_done)
+
+def run_profile_job(job, transcript):
+    """Background job for step 5: stream the analysis, reporting first token, size and validation"""
+    from pydantic import ValidationError
+    from veer_client_utils import UserProfile, analyze_profile
+    
+    parts = []
+    fields = {}
+    job.report(progress=0.05, message="Waiting for the first tokens...", parts=parts, fields=fields)
+    
+    def on_delta(delta):
+        parts.append(delta)
+        chars = job.details.get("chars", 0) + len(delta)
+        if chars == len(delta):
+            job.report(progress=0.1, message="First tokens received, generating your profile...")
+        job.report(progress=0.1 + 0.8 * min(chars / EXPECTED_PROFILE_CHARS, 1.0), chars=chars)
+    
+    def on_field(path, value):
+        # Finished fields are shown while the rest of the profile is generated
+        fields[path] = value.model_dump() if hasattr(value, "model_dump") else value
+        job.report(message=f"Wrote {path[-1].replace('_', ' ')}...")
+    
+    profile = analyze_profile(transcript, model="o4-mini", on_delta=on_delta, on_field=on_field)
+    
+    if "error" not in profile:
+        job.report(progress=0.95, message="Validating your profile...")
+        try:
+            UserProfile.model_validate(profile)
+            job.report(message="Profile validated")
+        except ValidationError as e:
+            # Step 6 renders partial profiles defensively, so keep what we got
+            job.report(message=f"Profile is missing {e.error_count()} field(s); showing what was generated")
+    return profile
+
+def summarize_field(value):
+    """One line of text for a profile field value of any shape"""
+    if isinstance(value, dict):
+        return "; ".join(f"{k.replace('_', ' ')}: {summarize_field(v)}" for k, v in value.items() if v)
+    if isinstance(value, list):
+        return "; ".join(summarize_field(v) for v in value if v)
+    return str(value)
+
+def render_partial_profile(fields):
+    """Markdown for the profile fields finished so far"""
+    lines = []
+    for path, value in list(fields.items()):
+        if len(path) == 2:
+            text = summarize_field(value) or "-"
+            if len(text) > 300:
+                text = text[:300] + "..."
+            lines.append(f"- **{path[1].replace('_', ' ').title()}:** {text}")
+    return "\n".join(lines)
+
+def poll_job(job, progress_bar, status_text, preview=None):
+    """Update the progress widgets from a background job until it finishes"""
+    while not job.done():
+        progress_bar.progress(job.progress)
+        status_text.text(job.message)
+        if preview is not None and job.details.get("fields"):
+            preview.markdown(render_partial_profile(job.details["fields"]))
+        elif preview is not None and job.details.get("parts"):
+            preview.code("".join(job.details["parts"])[-600:], language="json")
+        time.sleep(0.1)
+    progress_bar.progress(1.0)
 
 # Main app logic based on current step
 if st.session_state.step == 1:
@@ -239,13 +419,11 @@ elif st.session_state.step == 2:
                 st.session_state.recording_status = False
                 st.session_state.recording_feedback = "Recording saved!"
                 
-                # Save the audio to a temporary file
-                with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_audio:
-                    audio.export(temp_audio.name, format="wav")
-                    st.session_state.recordings.append(temp_audio.name)
+                # Keep the recording in memory, decoded for the recognizer once
+                recording = save_recording(audio)
                 
                 # Display the audio player
-                st.audio(audio.export().read(), format="audio/wav")
+                st.audio(recording["audio"], format="audio/wav")
                 
                 # Display duration
                 st.write(f"Recording duration: {audio.duration_seconds:.2f} seconds")
@@ -269,13 +447,11 @@ elif st.session_state.step == 2:
             audio_bytes = st.audio_input("Click to record your introduction", key="native_recorder")
             
             if audio_bytes:
-                # Save the recording to a temporary file
-                with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_audio:
-                    temp_audio.write(audio_bytes)
-                    st.session_state.recordings.append(temp_audio.name)
+                # Keep the recording in memory, decoded for the recognizer once
+                recording = save_recording(audio_bytes.getvalue() if hasattr(audio_bytes, "getvalue") else audio_bytes)
                 
                 # Display the audio player
-                st.audio(audio_bytes, format="audio/wav")
+                st.audio(recording["audio"], format="audio/wav")
                 st.session_state.recording_feedback = "Recording saved!"
         
         # Method 3: Allow file upload as last resort
@@ -287,13 +463,11 @@ elif st.session_state.step == 2:
                                             key="file_uploader")
             
             if uploaded_file is not None:
-                # Save the uploaded file to a temporary file
-                with tempfile.NamedTemporaryFile(suffix="." + uploaded_file.name.split(".")[-1], delete=False) as temp_audio:
-                    temp_audio.write(uploaded_file.getvalue())
-                    st.session_state.recordings.append(temp_audio.name)
+                # Keep the upload in memory, decoded for the recognizer once
+                recording = save_recording(uploaded_file.getvalue(), format=uploaded_file.name.split(".")[-1].lower())
                 
                 # Display the audio player
-                st.audio(uploaded_file.getvalue())
+                st.audio(recording["audio"])
                 st.session_state.recording_feedback = "Audio file saved!"
     
     # Option to continue or re-record (only show if we have a recording)
@@ -301,11 +475,7 @@ elif st.session_state.step == 2:
         col1, col2 = st.columns(2)
         with col1:
             if st.button("Re-record", key="rerecord_button"):
-                # Remove the temporary file
-                try:
-                    os.unlink(st.session_state.recordings[-1])
-                except:
-                    pass
+                cancel_jobs()
                 st.session_state.recordings.pop()
                 st.session_state.recording_feedback = "Ready to record again."
                 st.rerun()
@@ -327,20 +497,26 @@ elif st.session_state.step == 3:
     progress_bar = st.progress(0)
     status_text = st.empty()
     
-    for percent_complete in range(100):
-        # Simulate processing time
-        time.sleep(0.01)
-        progress_bar.progress(percent_complete + 1)
-        status_text.text(f"Processing: {percent_complete + 1}%")
-        
     if st.session_state.recordings:
-        latest_recording = st.session_state.recordings[-1]
-        status_text.text(f"Transcribing audio file: {latest_recording}")
+        # Usually already started (or finished) while the user was on step 2;
+        # a rerun picks up the job already in progress
+        job = st.session_state.get("transcription_job")
+        if job is None:
+            start_transcription_job(st.session_state.recordings[-1])
+            job = st.session_state.transcription_job
+        poll_job(job, progress_bar, status_text)
+        del st.session_state["transcription_job"]
         
-        # Actually transcribe the audio
-        transcript = transcribe_audio(latest_recording)
-        st.session_state.transcript = transcript
-        status_text.text("Transcription complete!")
+        try:
+            st.session_state.transcript = job.result()
+            status_text.text("Transcription complete!")
+            # The transcript is final now, so speculatively analyze it while it is reviewed
+            ensure_profile_job(with_name(st.session_state.transcript, st.session_state.user_name))
+        except (Exception, JobCancelled) as e:
+            # Send the user back to the recording step with the reason
+            st.session_state.recording_feedback = f"Transcription failed ({e}). Please try again."
+            st.session_state.step = 2
+            st.rerun()
     else:
         st.error("No recording found to transcribe!")
     
@@ -355,12 +531,18 @@ elif st.session_state.step == 4:
     st.markdown("Below is the transcription of your recording. You can edit it if needed.")
     st.markdown('</div>', unsafe_allow_html=True)
     
+    if st.session_state.profile_feedback:
+        st.error(st.session_state.profile_feedback)
+    
     # Display and allow editing of the transcript
     edited_transcript = st.text_area("Edit your transcript if needed:", 
                                     value=st.session_state.transcript, 
                                     height=300)
     st.session_state.transcript = edited_transcript
     
+    # An edit cancels the speculative analysis; step 5 starts one on the final text
+    ensure_profile_job(with_name(edited_transcript, st.session_state.user_name), start=False)
+    
     # Add buttons in columns
     col1, col2 = st.columns(2)
     with col1:
@@ -369,6 +551,7 @@ elif st.session_state.step == 4:
             st.rerun()
     with col2:
         if st.button("Generate Profile", type="primary", key="generate_profile_button"):
+            st.session_state.profile_feedback = ""
             st.session_state.step = 5
             st.rerun()
 
@@ -380,24 +563,28 @@ elif st.session_state.step == 5:
     st.markdown('</div>', unsafe_allow_html=True)
     
     progress_bar = st.progress(0)
+    status_text = st.empty()
+    preview = st.empty()
     
-    for percent_complete in range(100):
-        time.sleep(0.02)
-        progress_bar.progress(percent_complete + 1)
-    
-    # Initialize gai client
-    gai = gai_client()
-    
-    # Properly prepend the name to the transcript if it's not already there
-    transcript_with_name = st.session_state.transcript
-    if not transcript_with_name.lower().startswith(f"my name is {st.session_state.user_name.lower()}"):
-        transcript_with_name = f"My name is {st.session_state.user_name}. " + transcript_with_name
-    
-    # Call the LLM to analyze the profile
-    st.session_state.profile = analyze_profile(transcript_with_name, model="o4-mini")
+    # Reuse the speculative analysis when the transcript is unchanged; a rerun
+    # picks up the job already in progress
+    job = ensure_profile_job(with_name(st.session_state.transcript, st.session_state.user_name))
+    poll_job(job, progress_bar, status_text, preview)
+    try:
+        profile = job.result()
+    except (Exception, JobCancelled) as e:
+        profile = {"error": f"Profile analysis failed: {e}"}
+    
+    if "error" in profile:
+        # Drop the failed job so going back starts a fresh analysis, and say why
+        st.session_state.pop("profile_job", None)
+        st.session_state.profile_feedback = f"{profile['error']}. Please try again."
+        st.session_state.step = 4
+        st.rerun()
+    st.session_state.profile = profile
     
     # Force the name from the text input into the profile
-    if "outward_profile" in st.session_state.profile:
+    if isinstance(st.session_state.profile.get("outward_profile"), dict):
         st.session_state.profile["outward_profile"]["name"] = st.session_state.user_name
     
     st.session_state.step = 6
@@ -410,7 +597,7 @@ elif st.session_state.step == 6:
     st.markdown("### Your Veer Profile 📊")
     st.markdown("Here's your profile based on your responses. This outward profile will be visible to potential connections.")
     
-    outward = st.session_state.profile["outward_profile"]
+    outward = st.session_state.profile.get("outward_profile") or {}
     
     # Display name with fallback to the user input name
     name = outward.get('name', st.session_state.user_name)
@@ -481,7 +668,7 @@ elif st.session_state.step == 6:
     with st.expander("Inward Profile (For Matching Algorithm)", expanded=True):
         st.markdown("This internal profile helps our algorithm find the best matches for you. This information is not shared publicly.")
         
-        inward = st.session_state.profile.get("inward_profile", {})
+        inward = st.session_state.profile.get("inward_profile") or {}
         
         # Display personality traits with safety checks
         st.markdown("**Personality Traits:**")
@@ -556,15 +743,6 @@ elif st.session_state.step == 6:
     """)
     st.markdown('</div>', unsafe_allow_html=True)
     
-    # Clean up temporary files when done
-    if st.session_state.recordings:
-        for recording_path in st.session_state.recordings:
-            try:
-                if os.path.exists(recording_path):
-                    os.unlink(recording_path)
-            except Exception as e:
-                st.warning(f"Could not remove temporary file {recording_path}: {e}")
-    
     # Updated navigation buttons with Edit Transcript option
     col1, col2, col3 = st.columns(3)
     with col1:
@@ -573,6 +751,7 @@ elif st.session_state.step == 6:
             st.rerun()
     with col2:
         if st.button("Start Over", key="start_over_button"):
+            cancel_jobs()
             for key in st.session_state.keys():
                 del st.session_state[key]
             st.rerun()
@@ -0,0 +1,123 @@
+"""
+Compare the profile analysis prompt variants (veer_client_utils.PROFILE_PROMPTS).
+
+By default only counts prompt tokens per transcript, without calling the API.
+With --live every transcript is analyzed with each variant, caching disabled,
+and the report adds the tokens the provider actually billed, how many of them
+came from its prompt cache, latency and whether the output validated.
+Repeats of the same variant show the prompt cache warming up.
+
+Usage:
+    python prompt_benchmark.py transcripts/
+    python prompt_benchmark.py transcripts/ --live --repeats 2 -m gpt-4.1
+"""
+from typing import Dict, List
+import argparse
+import time
+
+from batch_profiles import iter_local_transcripts
+
+
+def _mean(values: List) -> float:
+    values = [v for v in values if v is not None]
+    return sum(values) / len(values) if values else None
+
+
+def count_prompt_tokens(transcripts: Dict[str, str], variants: List[str]) -> Dict[str, List[Dict]]:
+    """gai_utils.prompt_token_report for every transcript under every variant."""
+    from gai_utils import prompt_token_report
+    from veer_client_utils import PROFILE_PROMPTS, TRANSCRIPT_PREFIX, user_profile_schema
+
+    return {
+        variant: [prompt_token_report(TRANSCRIPT_PREFIX + text, PROFILE_PROMPTS[variant], user_profile_schema)
+                  for text in transcripts.values()]
+        for variant in variants
+    }
+
+
+def run_live(transcripts: Dict[str, str], variants: List[str], model: str, repeats: int) -> Dict[str, List[Dict]]:
+    """Analyze every transcript with every variant and record billed tokens, latency and validity."""
+    from pydantic import ValidationError
+    from veer_client_utils import UserProfile, analyze_profile
+
+    rows = {variant: [] for variant in variants}
+    for variant in variants:
+        for repeat in range(repeats):
+            for transcript_id, text in transcripts.items():
+                usage = {}
+                started = time.perf_counter()
+                profile = analyze_profile(text, model=model, use_cache=False, on_usage=usage.update,
+                                          prompt_variant=variant)
+                valid = "error" not in profile
+                if valid:
+                    try:
+                        UserProfile.model_validate(profile)
+                    except ValidationError:
+                        valid = False
+                rows[variant].append(dict(usage, id=transcript_id, repeat=repeat, valid=valid,
+                                          wall=time.perf_counter() - started))
+                print(f"{variant} #{repeat + 1} {transcript_id}: {usage.get('prompt_tokens')} prompt tokens "
+                      f"({usage.get('cached_prompt_tokens') or 0} cached), {time.perf_counter() - started:.1f}s"
+                      f"{'' if valid else ', INVALID'}")
+    return rows
+
+
+def summarize(rows: Dict[str, List[Dict]]) -> Dict[str, Dict]:
+    """Mean of every numeric field per variant (valid becomes the share of valid outputs)."""
+    summary = {}
+    for variant, records in rows.items():
+        fields = {k for r in records for k, v in r.items() if isinstance(v, (int, float))}
+        summary[variant] = {k: _mean([r.get(k) for r in records]) for k in sorted(fields)}
+    return summary
+
+
+def print_summary(title: str, summary: Dict[str, Dict], columns: List[str], baseline: str = "full"):
+    print(f"\n{title}")
+    print("  " + "variant".ljust(10) + "".join(c.rjust(22) for c in columns))
+    for variant, values in summary.items():
+        cells = []
+        for column in columns:
+            value = values.get(column)
+            base = summary.get(baseline, {}).get(column)
+            cell = "-" if value is None else f"{value:.2f}" if isinstance(value, float) and value < 100 else f"{value:.0f}"
+            if variant != baseline and value is not None and base:
+                cell += f" ({(value - base) / base:+.0%})"
+            cells.append(cell.rjust(22))
+        print("  " + variant.ljust(10) + "".join(cells))
+
+
+def main():
+    from veer_client_utils import PROFILE_PROMPTS
+
+    parser = argparse.ArgumentParser(description="Compare token cost and latency of the profile prompt variants.")
+    parser.add_argument("source", help="Directory of .txt transcripts")
+    parser.add_argument("--variants", nargs="+", default=list(PROFILE_PROMPTS), choices=list(PROFILE_PROMPTS))
+    parser.add_argument("--live", action="store_true", help="Call the API, not just count tokens")
+    parser.add_argument("-m", "--model", default="o4-mini", help="Model for --live runs")
+    parser.add_argument("--repeats", type=int, default=1, help="Runs per transcript and variant with --live")
+    parser.add_argument("--limit", type=int, default=None, help="Only use this many transcripts")
+    args = parser.parse_args()
+
+    transcripts = {}
+    for transcript_id, load in iter_local_transcripts(args.source):
+        if args.limit is not None and len(transcripts) >= args.limit:
+            break
+        transcripts[transcript_id] = load()
+    if not transcripts:
+        parser.error(f"No .txt transcripts found in {args.source}")
+
+    counted = summarize(count_prompt_tokens(transcripts, args.variants))
+    exact = all(v.get("exact") for v in counted.values())
+    print_summary(f"Prompt tokens per call over {len(transcripts)} transcript(s)"
+                  f"{'' if exact else ' (estimated; pip install tiktoken for exact counts)'}",
+                  counted, ["total", "static_prefix", "system", "schema", "user", "cacheable"])
+
+    if args.live:
+        measured = summarize(run_live(transcripts, args.variants, args.model, args.repeats))
+        print_summary(f"Measured with {args.model}", measured,
+                      ["prompt_tokens", "cached_prompt_tokens", "completion_tokens",
+                       "time_to_first_token", "elapsed", "valid"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('AWS_ID', 'testing')
+os.environ.setdefault('AWS_SEC', 'testing')
+
+moto = pytest.importorskip('moto')
+import aws_utils
+
+
+@pytest.fixture
+def s3_client():
+    with moto.mock_aws():
+        aws_utils.configure_s3()  # drop clients built outside the mock
+        client = aws_utils.connect_to_s3(client=True)
+        client.create_bucket(Bucket='veer-dumps')
+        yield client
+    aws_utils.configure_s3()
+
+
+def test_manifest_finds_new_dump_after_non_dump_key(s3_client, tmp_path):
+    manifest = str(tmp_path / 'manifest.json')
+    s3_client.put_object(Bucket='veer-dumps', Key='notes.csv', Body=b'a')
+    assert list(aws_utils.list_s3_keys('veer-dumps', s3_client, manifest_path=manifest)) == ['notes.csv']
+
+    s3_client.put_object(Bucket='veer-dumps', Key='20261018101010.csv', Body=b'a')
+    keys = list(aws_utils.list_s3_keys('veer-dumps', s3_client, manifest_path=manifest))
+    assert sorted(keys) == ['20261018101010.csv', 'notes.csv']
+
+    # The dump is now recorded, so the index alone covers it
+    keys = list(aws_utils.list_s3_keys('veer-dumps', s3_client, manifest_path=manifest))
+    assert sorted(keys) == ['20261018101010.csv', 'notes.csv']
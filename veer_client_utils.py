@@ -1,7 +1,9 @@
-from typing import Dict, Optional, List, Union
+from typing import Callable, Dict, Optional, List, Union
 from pydantic import BaseModel, Field
-from azure.ai.inference.models._models import JsonSchemaFormat
+from concurrent.futures import ThreadPoolExecutor
+import bisect
 import json
+import threading
 from gai_utils import gai_client
 
 # Initialize the client
@@ -88,11 +90,39 @@ class UserProfile(BaseModel):
     outward_profile: OutwardProfile
     inward_profile: InwardProfile
 
-# Create JsonSchemaFormat object for the client
-user_profile_schema = JsonSchemaFormat(
-    schema=UserProfile.model_json_schema(),
-    name="UserProfile"
-)
+class InwardTraits(BaseModel):
+    """Personality and communication part of the inward profile (split analysis)"""
+    personality_traits: PersonalityTraits
+    communication_style: CommunicationStyle
+
+class InwardAssessment(BaseModel):
+    """Insights, believability, concerns and recommendations part of the inward profile (split analysis)"""
+    psychological_insights: PsychologicalInsights
+    believability_assessment: BelievabilityAssessment
+    potential_concerns: Dict[str, str] = Field(
+        description="Potential concerns or growth areas",
+        default_factory=dict
+    )
+    matching_recommendations: MatchingRecommendations
+
+# JsonSchemaFormat objects for the client, built on first use (schema generation
+# and the azure SDK import are not needed until a profile is analyzed)
+_schema_formats = {}
+
+def json_schema_format(model):
+    """The JsonSchemaFormat response format for a pydantic model, created once."""
+    if model not in _schema_formats:
+        from azure.ai.inference.models._models import JsonSchemaFormat
+        _schema_formats[model] = JsonSchemaFormat(schema=model.model_json_schema(), name=model.__name__)
+    return _schema_formats[model]
+
+def __getattr__(name):
+    # Module attributes that used to be built at import time
+    if name == "user_profile_schema":
+        return json_schema_format(UserProfile)
+    if name == "profile_part_schemas":
+        return {part: json_schema_format(model) for part, (model, _) in PROFILE_PARTS.items()}
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # LLM prompt for profile analysis with example output
 # LLM prompt for profile analysis with proper name handling
@@ -210,28 +240,149 @@ Focus only on information provided in the transcript. Make reasonable inferences
 invent details not implied by the transcript. Use neutral, balanced language in your assessments.
 """
 
-def analyze_profile(transcript: str, model: str = "o4-mini") -> Dict:
+# Same instructions without the example output: the response format already
+# carries the full schema, field descriptions included, so the example only
+# repeats it. Still static, so it stays a cacheable prefix together with the schema.
+profile_analysis_prompt_compact = """
+You are an expert psychological profiler and goal analyst for Veer, a goal manifestation and matchmaking
+platform serving Nepali communities in Nepal and the diaspora. Analyze the transcript of a user speaking
+about themselves and fill in the dual-layer profile defined by the JSON schema.
+
+- The transcript starts with "My name is [Name]". Use exactly that name as outward_profile.name.
+- Consider cultural factors relevant to Nepali culture and the diaspora experience. Base psychological
+  assessments on linguistic markers, expressed values and behavioral patterns in the transcript.
+- outward_profile is public: background, primary and secondary goals, motivations, challenges,
+  connection needs and skills.
+- inward_profile is for internal matching only. Write each personality trait, communication style,
+  growth mindset and believability field as "[assessment] - [evidence from transcript]". Give
+  potential_concerns as concern name -> description, and specific mentor and peer types.
+- Fill every field the transcript supports; do not write "Not specified" or "Unknown" unless the
+  information is genuinely absent.
+- Use only what the transcript states or clearly implies, and neutral, balanced language.
+"""
+
+TRANSCRIPT_PREFIX = "Here is the transcript to analyze:\n\n"
+
+PROFILE_PROMPTS = {
+    "full": profile_analysis_prompt,
+    "compact": profile_analysis_prompt_compact,
+}
+
+# Split analysis: each part of the profile is its own schema-constrained call,
+# all running at once. The shared preamble keeps the parts' prompts on a common
+# cacheable prefix; only the closing instruction and the schema differ.
+profile_part_prompt = """
+You are an expert psychological profiler and goal analyst for Veer, a goal manifestation and matchmaking
+platform serving Nepali communities in Nepal and the diaspora. Analyze the transcript of a user speaking
+about themselves. Consider cultural factors relevant to Nepali culture and the diaspora experience, and
+base psychological assessments on linguistic markers, expressed values and behavioral patterns. Fill
+every field the transcript supports, use only what it states or clearly implies, and use neutral,
+balanced language.
+
+This request covers one part of the user's profile, defined by the JSON schema:
+"""
+
+PROFILE_PARTS = {
+    "outward": (OutwardProfile, """
+The public outward profile. The transcript starts with "My name is [Name]"; use exactly that name. Give
+the background, primary and secondary goals, motivations, challenges, connection needs and skills.
+"""),
+    "traits": (InwardTraits, """
+The Big Five personality traits and communication style, for internal matching only. Write each field
+as "[assessment] - [evidence from transcript]".
+"""),
+    "assessment": (InwardAssessment, """
+Psychological insights, believability assessment, potential concerns (concern name -> description) and
+specific mentor and peer types to match with, for internal matching only. Write growth mindset and each
+believability field as "[assessment] - [evidence from transcript]".
+"""),
+}
+
+def _combine_usage(usages: List[Dict]) -> Dict:
+    """One usage record for calls that ran concurrently: tokens add up, time is the slowest call's."""
+    usages = [u for u in usages if u]
+    def total(key):
+        values = [u.get(key) for u in usages]
+        return None if any(v is None for v in values) else sum(values)
+    firsts = [u["time_to_first_token"] for u in usages if u.get("time_to_first_token") is not None]
+    return {
+        "prompt_tokens": total("prompt_tokens"),
+        "completion_tokens": total("completion_tokens"),
+        "total_tokens": total("total_tokens"),
+        "cached_prompt_tokens": total("cached_prompt_tokens"),
+        "time_to_first_token": min(firsts) if firsts else None,
+        "elapsed": max((u.get("elapsed") or 0.0 for u in usages), default=0.0),
+        "cached": bool(usages) and all(u.get("cached") for u in usages),
+        "parts": len(usages),
+    }
+
+def analyze_profile(transcript: str, model: str = "o4-mini",
+                    on_delta: Optional[Callable[[str], None]] = None,
+                    use_cache: bool = True,
+                    on_usage: Optional[Callable[[Dict], None]] = None,
+                    hedge: bool = False,
+                    prompt_variant: str = "full",
+                    split: bool = False,
+                    on_field: Optional[Callable[[tuple, object], None]] = None) -> Dict:
     """
     Analyzes a user transcript to generate a dual-layer profile using the gai_client.
     
     Args:
         transcript: The user's transcribed speech
         model: The model to use for analysis (default: o4-mini)
+        on_delta: Optional callback; when given the response is streamed and
+            each text delta is passed to it as it arrives
+        use_cache: Reuse a stored response for an identical request (same model,
+            prompt, schema, temperature and transcript) instead of calling the API
+        on_usage: Optional callback; when given the response is streamed and the
+            token usage record (see gai_utils.TextStream.usage) is passed to it
+        hedge: Race a duplicate request on an equivalent deployment when the
+            first is slower than usual (see gai_client.openai_text)
+        prompt_variant: Key of PROFILE_PROMPTS to use as the system message
+            ('full' with the example output, or 'compact')
+        split: Generate the parts in PROFILE_PARTS with concurrent calls and
+            merge them, so the wait is the slowest part rather than the whole
+            profile. on_usage gets their combined usage and on_field the
+            fields of every part; on_delta raises ValueError, since the
+            parts' text would interleave (see analyze_profile_split).
+        on_field: Optional callback; when given the response is streamed and
+            on_field(path, value) is called for each profile field as soon as
+            it is complete and valid (see ProfileStreamParser)
     
     Returns:
         Dict: The analyzed profile as a dictionary
     """
+    if split:
+        return analyze_profile_split(transcript, model=model, on_delta=on_delta, use_cache=use_cache,
+                                     on_usage=on_usage, hedge=hedge, on_field=on_field)
+    stream = on_delta is not None or on_usage is not None or on_field is not None
     try:
-        # Call the API with the schema-based approach
+        # The system message and schema are the same on every call and go first,
+        # so Azure can serve them from its prompt cache; only the transcript varies
         result = gai.openai_text(
-            prompt=f"Here is the transcript to analyze:\n\n{transcript}",
+            prompt=f"{TRANSCRIPT_PREFIX}{transcript}",
             model=model,
             temperature=0.2,
             max_tokens=4000,
-            sysmsg=profile_analysis_prompt,
+            sysmsg=PROFILE_PROMPTS[prompt_variant],
             to_json=True,
-            json_schema=user_profile_schema
+            json_schema=json_schema_format(UserProfile),
+            stream=stream,
+            use_cache=use_cache,
+            hedge=hedge
         )
+        if stream:
+            text_stream = result
+            parser = ProfileStreamParser() if on_field is not None else None
+            for delta in text_stream:
+                if on_delta is not None:
+                    on_delta(delta)
+                if parser is not None:
+                    for path, value in parser.feed(delta):
+                        on_field(path, value)
+            result = text_stream.text
+            if on_usage is not None:
+                on_usage(text_stream.usage)
         
         # Parse the response
         profile_data = json.loads(result)
@@ -243,4 +394,260 @@ def analyze_profile(transcript: str, model: str = "o4-mini") -> Dict:
             "error": f"Profile analysis failed: {str(e)}",
             "outward_profile": {},
             "inward_profile": {}
-        }
\ No newline at end of file
+        }
+
+def analyze_profile_part(part: str, transcript: str, model: str = "o4-mini",
+                         on_delta: Optional[Callable[[str], None]] = None,
+                         use_cache: bool = True,
+                         hedge: bool = False,
+                         on_field: Optional[Callable[[tuple, object], None]] = None):
+    """
+    Generate one part of the profile (a key of PROFILE_PARTS) and validate it.
+    
+    Returns:
+        (part_model, usage): the validated pydantic object for the part and the
+        call's usage record (None when not streamed)
+    """
+    part_model, instructions = PROFILE_PARTS[part]
+    stream = on_delta is not None or on_field is not None
+    result = gai.openai_text(
+        prompt=f"{TRANSCRIPT_PREFIX}{transcript}",
+        model=model,
+        temperature=0.2,
+        max_tokens=4000,
+        sysmsg=profile_part_prompt + instructions,
+        to_json=True,
+        json_schema=json_schema_format(part_model),
+        stream=stream,
+        use_cache=use_cache,
+        hedge=hedge
+    )
+    usage = None
+    if stream:
+        parser = ProfileStreamParser((PROFILE_PART_SECTIONS[part],)) if on_field is not None else None
+        for delta in result:
+            if on_delta is not None:
+                on_delta(delta)
+            if parser is not None:
+                for path, value in parser.feed(delta):
+                    on_field(path, value)
+        usage = result.usage
+        result = result.text
+    return part_model.model_validate_json(result), usage
+
+def analyze_profile_split(transcript: str, model: str = "o4-mini",
+                          on_delta: Optional[Callable[[str], None]] = None,
+                          use_cache: bool = True,
+                          on_usage: Optional[Callable[[Dict], None]] = None,
+                          hedge: bool = False,
+                          on_field: Optional[Callable[[tuple, object], None]] = None) -> Dict:
+    """
+    Analyzes a transcript with one concurrent call per part of the profile.
+    
+    The outward profile, the personality and communication traits, and the
+    remaining assessments are generated in parallel, each validated against
+    its pydantic class, then merged and validated as a UserProfile. Takes the
+    same arguments as analyze_profile and returns the same dictionary (or the
+    same error dictionary if any part fails). on_delta is rejected: the parts
+    stream at once, so their deltas would not add up to one document.
+    """
+    if on_delta is not None:
+        raise ValueError("on_delta is not supported with split analysis; use on_field instead")
+    stream = on_usage is not None or on_field is not None
+    lock = threading.Lock()
+    
+    def ignore(delta):
+        # Streaming is only needed for usage and fields; the text itself is not forwarded
+        pass
+    
+    def forward_field(path, value):
+        # Parts stream from different threads; callers get one callback at a time
+        with lock:
+            on_field(path, value)
+    
+    try:
+        with ThreadPoolExecutor(max_workers=len(PROFILE_PARTS)) as pool:
+            futures = {
+                part: pool.submit(analyze_profile_part, part, transcript, model,
+                                  ignore if stream else None, use_cache, hedge,
+                                  forward_field if on_field is not None else None)
+                for part in PROFILE_PARTS
+            }
+            results = {part: future.result() for part, future in futures.items()}
+        
+        inward = InwardProfile(**dict(results["traits"][0]), **dict(results["assessment"][0]))
+        profile = UserProfile(outward_profile=results["outward"][0], inward_profile=inward)
+        if on_usage is not None:
+            on_usage(_combine_usage([usage for _, usage in results.values()]))
+        return profile.model_dump()
+        
+    except Exception as e:
+        return {
+            "error": f"Profile analysis failed: {str(e)}",
+            "outward_profile": {},
+            "inward_profile": {}
+        }
+
+# Top-level sections of a UserProfile document and the model each one validates against
+PROFILE_SECTIONS = {
+    "outward_profile": OutwardProfile,
+    "inward_profile": InwardProfile,
+}
+
+# Where the document produced by each split-analysis part sits inside a UserProfile
+PROFILE_PART_SECTIONS = {
+    "outward": "outward_profile",
+    "traits": "inward_profile",
+    "assessment": "inward_profile",
+}
+
+class ProfileStreamParser:
+    """
+    Incremental parser for a UserProfile JSON document arriving in pieces.
+    
+    feed() takes each streamed delta and returns the fields that closed in it
+    as (path, value) pairs, e.g. (("outward_profile", "name"), "Asha"), each
+    validated against its pydantic field type (a PersonalityTraits field comes
+    back as a PersonalityTraits object). A whole section closing is reported
+    as its model, e.g. (("outward_profile",), OutwardProfile(...)). Fields that
+    do not validate are skipped; the full document still gets validated once
+    it is complete.
+    
+    The scanner keeps one frame per open object or array and looks at each
+    character once; only a value that just closed is sliced out of the deltas
+    it spans and handed to json.loads.
+    """
+    
+    def __init__(self, prefix: tuple = ()):
+        """
+        Args:
+            prefix: Path of the document inside a UserProfile, for parsing a
+                part on its own (e.g. ("outward_profile",) for an OutwardProfile)
+        """
+        self.prefix = tuple(prefix)
+        self.fields: Dict[tuple, object] = {}
+        self._chunks = []         # deltas as received, and the offset each one starts at
+        self._offsets = []
+        self._length = 0
+        self._stack = []          # open containers: [kind, current key, value start, scalar start]
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._root_start = None
+        self._adapters = {}
+    
+    def feed(self, delta: str) -> List[tuple]:
+        """Consume the next piece of the document; returns the (path, value) pairs completed by it."""
+        events = []
+        offset = self._length
+        self._chunks.append(delta)
+        self._offsets.append(offset)
+        self._length += len(delta)
+        for i, c in enumerate(delta, offset):
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    self._close_string(i + 1, events)
+                continue
+            if c in " \t\r\n":
+                continue
+            frame = self._stack[-1] if self._stack else None
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+                if frame is None or frame[0] == "[" or frame[1] is not None:
+                    self._start_value(i)
+            elif c in "{[":
+                self._start_value(i)
+                self._stack.append([c, None, None, None])
+            elif c in "}]":
+                self._close_scalar(i, events)
+                self._stack.pop()
+                self._close_value(i + 1, events)
+            elif c == ",":
+                self._close_scalar(i, events)
+                if frame is not None and frame[0] == "{":
+                    frame[1] = None
+            elif c == ":":
+                pass
+            elif frame is None or frame[3] is None:
+                # First character of a number, true, false or null
+                self._start_value(i)
+                if frame is not None:
+                    frame[3] = i
+        return events
+    
+    @property
+    def partial(self) -> Dict:
+        """The fields completed so far, nested like a UserProfile dict."""
+        profile = {}
+        for path, value in self.fields.items():
+            if len(path) == 2:
+                profile.setdefault(path[0], {})[path[1]] = value.model_dump() if hasattr(value, "model_dump") else value
+        return profile
+    
+    def _source(self, start: int, end: int) -> str:
+        # Join only the deltas the value spans, so the cost is its own length
+        first = bisect.bisect_right(self._offsets, start) - 1
+        last = bisect.bisect_left(self._offsets, end)
+        text = "".join(self._chunks[first:last])
+        base = self._offsets[first]
+        return text[start - base:end - base]
+    
+    def _start_value(self, i: int):
+        if self._stack:
+            self._stack[-1][2] = i
+        else:
+            self._root_start = i
+    
+    def _close_string(self, end: int, events: list):
+        frame = self._stack[-1] if self._stack else None
+        if frame is not None and frame[0] == "{" and frame[1] is None:
+            frame[1] = json.loads(self._source(self._string_start, end))
+        else:
+            self._close_value(end, events)
+    
+    def _close_scalar(self, end: int, events: list):
+        frame = self._stack[-1] if self._stack else None
+        if frame is not None and frame[3] is not None:
+            frame[3] = None
+            self._close_value(end, events)
+    
+    def _close_value(self, end: int, events: list):
+        """A value inside the innermost open container (or the whole document) just ended."""
+        frame = self._stack[-1] if self._stack else None
+        if frame is None:
+            path, start = self.prefix, self._root_start
+        elif frame[0] == "{" and all(f[0] == "{" for f in self._stack):
+            path, start = self.prefix + tuple(f[1] for f in self._stack), frame[2]
+        else:
+            # Inside an array, or deeper than a section field: nothing to report yet
+            return
+        if not 1 <= len(path) <= 2 or path[0] not in PROFILE_SECTIONS:
+            return
+        try:
+            value = self._validate(path, json.loads(self._source(start, end)))
+        except (ValueError, KeyError):
+            return
+        self.fields[path] = value
+        events.append((path, value))
+    
+    def _validate(self, path: tuple, raw):
+        from pydantic import TypeAdapter
+        
+        model = PROFILE_SECTIONS[path[0]]
+        if len(path) == 1:
+            return model.model_validate(raw)
+        if path not in self._adapters:
+            self._adapters[path] = TypeAdapter(model.model_fields[path[1]].annotation)
+        return self._adapters[path].validate_python(raw)
+
+def iter_profile_fields(deltas, prefix: tuple = ()):
+    """Yield (path, value) for each profile field as soon as it closes in a stream of deltas."""
+    parser = ProfileStreamParser(prefix)
+    for delta in deltas:
+        yield from parser.feed(delta)